@@ -1,15 +1,21 @@
 from sink import ReplSink
-from record import ReplRecord
-from boto3 import resource
-from boto3.dynamodb.conditions import Attr
-from botocore.config import Config
+from record import ReplRecord, VectorClock
+from ratelimit import AdaptiveRateLimiter
+from projection import load_projection
+from autoscale import QueueMonitor, ConcurrencyScaler
+from metrics import MetricsServer, metric_name
+from hotkeys import HotKeyTracker, Debouncer, hot_key_id
+from profiling import Profiler, StageTracer
+from hydrate import Hydrator
+from riakhttp import RiakHttpClient
+from target import DynamoDBTarget, SQLiteTarget, NDJSONTarget, STALE, SKIPPED, HELD
+from concurrent.futures import ThreadPoolExecutor
 import os
 import time
 import signal
 import logging
-import json
+import zlib
 from urllib3.exceptions import HTTPError
-from decimal import Decimal
 
 class App:
     def __init__(self):
@@ -17,6 +23,32 @@ class App:
         self.logger = self.get_logger()
         self.sink = None
         self.table = None
+        self.hydrator = None
+        self.projection = load_projection(os.getenv('PROJECTION'))
+        self.delete_mode = os.getenv('DELETE_MODE', 'delete')
+        if self.delete_mode not in ('delete', 'tombstone'):
+            raise ValueError(f"Invalid delete mode {self.delete_mode}")
+        self.tombstone_ttl = int(os.getenv('TOMBSTONE_TTL', '604800'))
+        self.tombstone_ttl_attribute = os.getenv('TOMBSTONE_TTL_ATTRIBUTE', '_riak_ttl')
+        self.target = self.dynamodb_target()
+        self.batch_size = int(os.getenv('BATCH_SIZE', '100'))
+        self.start_time = None
+        self.first_record_time = None
+        self.limiter = self.setup_rate_limiter()
+        self.profiler = Profiler(self.logger, output_dir=os.getenv('PROFILE_DIR', '/tmp'),
+            duration=float(os.getenv('PROFILE_SECONDS', '30')))
+        self.tracer = StageTracer(self.logger, sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0')))
+        self.stats_interval = float(os.getenv('STATS_INTERVAL', '60'))
+        self.stats_time = time.monotonic()
+        self.queue_name = os.getenv('RIAK_QUEUE', 'q1_ttaaefs')
+        self.fetchers = self.setup_scaler('fetchers', 'FETCHERS')
+        self.writers = self.setup_scaler('writers', 'WRITERS')
+        self.hot_keys = self.setup_hot_keys()
+        self.debouncer = None
+        self.monitor = None
+        self.metrics = None
+        self.fetch_executor = None
+        self.write_executor = None
 
     def get_logger(self):
         logger = logging.getLogger()
@@ -28,21 +60,70 @@ class App:
         logger.setLevel(logging.INFO)
         return logger
 
+    def setup_rate_limiter(self):
+        rate = float(os.getenv('WRITE_RATE_INITIAL', '25'))
+        min_rate = float(os.getenv('WRITE_RATE_MIN', '1'))
+        max_rate = float(os.getenv('WRITE_RATE_MAX', '10000'))
+        increase = float(os.getenv('WRITE_RATE_INCREASE', '5'))
+        decrease = float(os.getenv('WRITE_RATE_DECREASE', '0.5'))
+        return AdaptiveRateLimiter(rate=rate, min_rate=min_rate, max_rate=max_rate, increase=increase, decrease=decrease)
+
+    def setup_scaler(self, name: str, prefix: str):
+        minimum = int(os.getenv(f'{prefix}_MIN', '1'))
+        maximum = int(os.getenv(f'{prefix}_MAX', str(minimum)))
+        catch_up = float(os.getenv('CATCH_UP_TARGET', '60'))
+        return ConcurrencyScaler(name, minimum, maximum, self.logger, catch_up=catch_up, low_water=self.batch_size)
+
+    def setup_hot_keys(self):
+        k = int(os.getenv('HOT_KEYS', '20'))
+        if k <= 0:
+            return None
+        return HotKeyTracker(k=k,
+            width=int(os.getenv('HOT_KEYS_SKETCH_WIDTH', '2048')),
+            depth=int(os.getenv('HOT_KEYS_SKETCH_DEPTH', '4')),
+            min_count=int(os.getenv('HOT_KEYS_MIN_COUNT', '100')),
+            decay_interval=float(os.getenv('HOT_KEYS_DECAY_INTERVAL', '60')))
+
+    def dynamodb_target(self):
+        return DynamoDBTarget(self, tombstones=self.delete_mode == 'tombstone', tombstone_ttl=self.tombstone_ttl,
+            tombstone_ttl_attribute=self.tombstone_ttl_attribute, projection=self.projection)
+
+    def setup_target(self):
+        target = os.getenv('REPL_TARGET', 'dynamodb')
+        path = os.getenv('REPL_TARGET_PATH')
+        self.logger.info(f"Setting up replication target={target} path={path}")
+        if target == 'dynamodb':
+            return self.dynamodb_target()
+        if target == 'sqlite':
+            return SQLiteTarget(path or 'repl.db', self.logger, tombstones=self.delete_mode == 'tombstone',
+                projection=self.projection)
+        if target == 'ndjson':
+            return NDJSONTarget(path or 'repl.ndjson', self.logger, projection=self.projection)
+        raise ValueError(f"Invalid replication target {target}")
+
     def setup_riak_sink(self):
         host = os.getenv('RIAK_HOST', 'localhost')
         port = int(os.getenv('RIAK_PORT', '8098'))
-        queue_name = os.getenv('RIAK_QUEUE', 'q1_ttaaefs')
         self.bucket_filter = os.getenv('RIAK_BUCKET', 'test')
-        self.logger.info(f"Setting up replication sink from host={host} port={port} queue_name={queue_name}")
-        return ReplSink(host=host, port=port, queue=queue_name, vc_format='dict')
+        self.logger.info(f"Setting up replication sink from host={host} port={port} queue_name={self.queue_name}")
+        # one connection per fetcher plus one for the queue monitor
+        return ReplSink(host=host, port=port, queue=self.queue_name, vc_format='vclock', maxsize=self.fetchers.maximum + 1)
 
     def setup_dynamodb_table(self):
+        # boto3 is slow to import so is deferred until the table is set up
+        from boto3 import resource
+        from botocore.config import Config
+
         connect_timeout = int(os.getenv('DYNAMODB_CONNECT_TIMEOUT', '1'))
         read_timeout = int(os.getenv('DYNAMODB_READ_TIMEOUT', '1'))
         retries = int(os.getenv('DYNAMODB_RETRIES', '1'))
-        config = Config(connect_timeout=connect_timeout, read_timeout=read_timeout, retries={'max_attempts': retries})
+        # writers share the table's low level client, so its pool needs a connection for each
+        config = Config(connect_timeout=connect_timeout, read_timeout=read_timeout, retries={'max_attempts': retries},
+            max_pool_connections=max(10, self.writers.maximum))
         endpoint_url = os.getenv('DYNAMODB_ENDPOINT_URL')
         table_name = os.getenv('DYNAMODB_TABLE', 'test')
+        if os.getenv('DYNAMODB_BACKEND', 'dynamodb') == 'memory':
+            return self.setup_memory_table(table_name)
         self.logger.info(f"Setting up dynamodb url={endpoint_url} connect_timeout={connect_timeout} read_timeout={read_timeout} retries={retries} table={table_name}")
         if endpoint_url:
             dynamodb = resource('dynamodb', endpoint_url=endpoint_url, config=config)
@@ -65,97 +146,364 @@ class App:
                 ProvisionedThroughput={'ReadCapacityUnits': 5,'WriteCapacityUnits': 5}
             )
             table.wait_until_exists()
+            if self.delete_mode == 'tombstone':
+                self.logger.info(f"Enabling TTL on attribute {self.tombstone_ttl_attribute} for tombstones")
+                dynamodb.meta.client.update_time_to_live(TableName=table_name,
+                    TimeToLiveSpecification={'Enabled': True, 'AttributeName': self.tombstone_ttl_attribute})
         return table
 
-    def get_vector_clocks_condition(self, vector_clocks: dict):
-        conditions = []
-        expression_attr_names = {'#vclocks':'_riak_vclocks'}
-        expression_attr_values = {}
-        i = 0
-        for k, v in vector_clocks.items():
-            conditions.append("attribute_not_exists(#vclocks.#a" + str(i) + ")")
-            conditions.append("#vclocks.#a" + str(i) + " < :v" + str(i))
-            expression_attr_names['#a' + str(i)] = k
-            expression_attr_values[':v' + str(i)] = v
-            i += 1
-        condition = " OR ".join(conditions)
-        return condition, expression_attr_names, expression_attr_values
+    def setup_memory_table(self, table_name: str):
+        from memtable import MemoryTable
+
+        latency = float(os.getenv('MEMORY_TABLE_LATENCY', '0'))
+        jitter = float(os.getenv('MEMORY_TABLE_JITTER', '0'))
+        throttle_rate = float(os.getenv('MEMORY_TABLE_THROTTLE_RATE', '0'))
+        write_capacity = os.getenv('MEMORY_TABLE_WRITE_CAPACITY')
+        if write_capacity is not None:
+            write_capacity = float(write_capacity)
+        self.logger.info(f"Setting up in-memory table={table_name} latency={latency} jitter={jitter} throttle_rate={throttle_rate} write_capacity={write_capacity}")
+        return MemoryTable(table_name, latency=latency, jitter=jitter, throttle_rate=throttle_rate, write_capacity=write_capacity)
+
+    def wait_until_ready(self, name: str, setup):
+        """Call setup until it succeeds, backing off exponentially between attempts.
+
+        Gives up and re-raises the last error after STARTUP_TIMEOUT seconds.
+        """
+        timeout = float(os.getenv('STARTUP_TIMEOUT', '120'))
+        backoff = float(os.getenv('STARTUP_BACKOFF_MIN', '0.1'))
+        backoff_max = float(os.getenv('STARTUP_BACKOFF_MAX', '5'))
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return setup()
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if self.shutdown or remaining <= 0:
+                    self.logger.error(f"{name} not ready after {timeout} seconds")
+                    raise
+                delay = min(backoff, backoff_max, remaining)
+                self.logger.warning(f"{name} not ready ({e}), retrying in {delay:.1f} seconds")
+                time.sleep(delay)
+                backoff *= 2
+
+    def setup_hydrator(self):
+        host = os.getenv('RIAK_HOST', 'localhost')
+        port = int(os.getenv('RIAK_PORT', '8098'))
+        workers = int(os.getenv('HYDRATE_WORKERS', '8'))
+        self.logger.info(f"Setting up hydration from host={host} port={port} workers={workers}")
+        return Hydrator(RiakHttpClient(host, port, maxsize=workers), self.logger, workers=workers)
+
+    def setup_riak(self):
+        sink = self.setup_riak_sink()
+        self.wait_until_ready("Riak", sink.ping)
+        return sink
+
+    def setup(self):
+        """Set up the Riak sink and DynamoDB table concurrently.
+
+        Both are retried until ready, which also leaves a warm connection in each HTTP pool.
+        """
+        self.target = self.setup_target()
+        self.hydrator = self.setup_hydrator()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='setup') as executor:
+            sink_future = executor.submit(self.setup_riak)
+            if isinstance(self.target, DynamoDBTarget):
+                table_future = executor.submit(self.wait_until_ready, "DynamoDB", self.setup_dynamodb_table)
+                self.table = table_future.result()
+            self.sink = sink_future.result()
+        self.logger.info(f"Startup completed in {time.monotonic() - self.start_time:.3f} seconds")
+
+    def setup_autoscaling(self):
+        """Start the queue monitor, concurrency pools and metrics server as configured."""
+        interval = float(os.getenv('QUEUE_MONITOR_INTERVAL', '0'))
+        if interval > 0:
+            stat = os.getenv('QUEUE_STAT', 'replrtq_queue_length')
+            window = float(os.getenv('QUEUE_MONITOR_WINDOW', '60'))
+            self.logger.info(f"Monitoring queue={self.queue_name} stat={stat} every {interval} seconds, "
+                f"fetchers={self.fetchers.minimum}-{self.fetchers.maximum} writers={self.writers.minimum}-{self.writers.maximum}")
+            self.monitor = QueueMonitor(self.sink.stats, self.queue_name, self.logger, stat,
+                interval=interval, window=window, on_sample=self.autoscale).start()
+        if self.fetchers.maximum > 1:
+            if self.delete_mode == 'delete':
+                self.logger.warning("Concurrent fetchers can reorder deletes, use DELETE_MODE=tombstone with the dynamodb or sqlite targets")
+            self.fetch_executor = ThreadPoolExecutor(max_workers=self.fetchers.maximum, thread_name_prefix='fetch')
+        if self.writers.maximum > 1:
+            self.write_executor = ThreadPoolExecutor(max_workers=self.writers.maximum, thread_name_prefix='write')
+        debounce = float(os.getenv('HOT_KEYS_DEBOUNCE', '0'))
+        if debounce > 0 and self.hot_keys is not None:
+            self.logger.info(f"Debouncing writes to hot keys every {debounce} seconds")
+            self.debouncer = Debouncer(debounce)
+        port = os.getenv('METRICS_PORT')
+        if port:
+            self.metrics = MetricsServer(int(port), self.collect_metrics, self.logger).start()
+            self.logger.info(f"Serving metrics on port {self.metrics.port}")
+
+    def autoscale(self, monitor: QueueMonitor):
+        length, eta = monitor.length, monitor.eta
+        self.fetchers.update(length, eta)
+        self.writers.update(length, eta)
+
+    def collect_metrics(self):
+        stats = self.limiter.stats()
+        metrics = {
+            'riak_repl_write_rate': stats['rate'],
+            'riak_repl_writes_total': stats['success_count'],
+            'riak_repl_throttles_total': stats['throttle_count'],
+            'riak_repl_fetchers': self.fetchers.value,
+            'riak_repl_writers': self.writers.value,
+        }
+        if self.monitor is not None:
+            queue = self.monitor.stats()
+            metrics[metric_name('riak_repl_queue_length', queue=self.queue_name)] = queue['length']
+            metrics[metric_name('riak_repl_queue_drain_rate', queue=self.queue_name)] = queue['drain_rate']
+            metrics[metric_name('riak_repl_queue_catch_up_seconds', queue=self.queue_name)] = queue['eta']
+        if self.hot_keys is not None:
+            for key, count in self.hot_keys.top():
+                metrics[metric_name('riak_repl_hot_key_count', key=key)] = count
+        if self.debouncer is not None:
+            metrics['riak_repl_debounce_pending'] = len(self.debouncer)
+            metrics['riak_repl_debounce_superseded_total'] = self.debouncer.superseded_count
+        return metrics
+
+    def bulk_load(self):
+        from bulkload import setup_bulk_loader
+
+        if not isinstance(self.target, DynamoDBTarget):
+            raise ValueError("Bulk load is only supported for the dynamodb target")
+        loader = setup_bulk_loader(self)
+        return loader.load(force=os.getenv('BULK_LOAD_FORCE', 'false').lower() == 'true')
+
+    def log_stats(self):
+        stats = self.limiter.stats()
+        self.logger.info(f"Write rate={stats['rate']:.1f}/s writes={stats['success_count']} throttles={stats['throttle_count']} wait_time={stats['wait_time']:.3f}")
+        if self.monitor is not None:
+            queue = self.monitor.stats()
+            drain_rate = 'unknown' if queue['drain_rate'] is None else f"{queue['drain_rate']:.1f}/s"
+            eta = 'unknown' if queue['eta'] is None else f"{queue['eta']:.0f}s"
+            self.logger.info(f"Queue length={queue['length']} drain_rate={drain_rate} eta={eta} "
+                f"fetchers={self.fetchers.value} writers={self.writers.value}")
+        if self.hot_keys is not None and self.hot_keys.count:
+            top = " ".join(f"{key}={count}" for key, count in self.hot_keys.top(10))
+            self.logger.info(f"Hot keys {top}")
+        if self.debouncer is not None:
+            self.logger.info(f"Debounce pending={len(self.debouncer)} held={self.debouncer.held_count} "
+                f"superseded={self.debouncer.superseded_count}")
 
     def update_item(self, key: str, rec: ReplRecord):
-        try:
-            data = json.loads(rec.value)
-            data['pkey'] = key
-            data['_riak_lm'] = Decimal(rec.last_modified)
-            data['_riak_vclocks'] = rec.vector_clocks
-            condition, attr_names, attr_values = self.get_vector_clocks_condition(rec.vector_clocks)
-            self.logger.info(f"Putting item key={key}")
-
-            self.table.put_item(
-                Item=data,
-                ConditionExpression=condition,
-                ExpressionAttributeNames=attr_names,
-                ExpressionAttributeValues=attr_values)
-        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
-            self.logger.warning(f"Put for key={key} failed due to vector clock mis-match")
-        except Exception as e:
-            self.logger.error(e)
+        """Put a single record through the DynamoDB target."""
+        return self.target.put_record(key, rec)
 
     def delete_item(self, key: str, rec: ReplRecord):
-        try:
-            self.logger.info(f"Deleting item key={key}")
-            condition, attr_names, attr_values = self.get_vector_clocks_condition(rec.vector_clocks)
-            self.table.delete_item(
-                Key={'pkey':key},
-                ConditionExpression=condition,
-                ExpressionAttributeNames=attr_names,
-                ExpressionAttributeValues=attr_values)
-        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
-            self.logger.warning(f"Delete for key={key} failed due to vector clock mis-match")
-        except Exception as e:
-            self.logger.error(e)
+        """Delete a single record through the DynamoDB target."""
+        return self.target.delete_record(key, rec)
 
-    def process_record(self, rec: ReplRecord):
+    def accept_record(self, rec: ReplRecord):
         bucket = rec.bucket.decode('utf-8')
-        key = rec.key.decode('utf-8')
-        if {b'content-type': b'application/json'} in rec.metadata and bucket == self.bucket_filter and not rec.is_delete:
-            self.update_item(key, rec)
-        elif bucket == self.bucket_filter and rec.is_delete:
-            self.delete_item(key, rec)
-        else:
-            self.logger.warning(f"Key not JSON or wrong bucket {bucket} {key}")
+        if rec.head_only and not rec.is_delete:
+            self.logger.warning(f"Key not hydrated {bucket} {rec.key.decode('utf-8')}")
+            return False
+        if bucket == self.bucket_filter and (rec.is_delete or rec.content_type == b'application/json'):
+            return True
+        self.logger.warning(f"Key not JSON or wrong bucket {bucket} {rec.key.decode('utf-8')}")
+        return False
+
+    def coalesce(self, records: list):
+        """Drop records which are descended by another record for the same key in the batch.
+
+        Only records with VectorClock clocks are compared, concurrent versions are all kept.
+        """
+        latest = {}
+        dropped = set()
+        for i, rec in enumerate(records):
+            if not isinstance(rec.vector_clocks, VectorClock):
+                continue
+            versions = latest.setdefault((rec.bucket_type, rec.bucket, rec.key), [])
+            for j in list(versions):
+                if records[j].vector_clocks.descends(rec.vector_clocks):
+                    dropped.add(i)
+                    break
+                if rec.vector_clocks.descends(records[j].vector_clocks):
+                    dropped.add(j)
+                    versions.remove(j)
+            if i not in dropped:
+                versions.append(i)
+        if dropped:
+            self.logger.info(f"Coalesced {len(dropped)} superseded records")
+        return [rec for i, rec in enumerate(records) if i not in dropped]
+
+    def process_records(self, records: list):
+        """Hydrate and filter a batch of records and apply the accepted ones to the target in a single call.
+
+        Returns a result for each record in the same order: SKIPPED if it was not
+        accepted, HELD if it is held back for debouncing, STALE if superseded by a
+        later record in the batch, otherwise the result from the target.
+        """
+        if self.hydrator is not None:
+            # only fetch objects which can be accepted, full-sync references cover every bucket
+            self.hydrator.hydrate([rec for rec in records if rec.bucket.decode('utf-8') == self.bucket_filter])
+        results = {}
+        accepted = []
+        for rec in records:
+            if self.accept_record(rec):
+                accepted.append(rec)
+            else:
+                results[id(rec)] = SKIPPED
+        write = accepted
+        if self.hot_keys is not None:
+            write = self.track_hot_keys(accepted)
+            results.update((id(rec), HELD) for rec in accepted)
+        results.update((id(rec), STALE) for rec in write)
+        write = self.coalesce(write)
+        if write:
+            results.update(zip(map(id, write), self.apply_records(write)))
+        for rec in records:
+            if rec.trace is not None:
+                self.tracer.finish(rec)
+        return [results[id(rec)] for rec in records]
+
+    def track_hot_keys(self, records: list):
+        """Count records per key, returning those to write now.
+
+        With debouncing, records for hot keys, and any later records for keys
+        still held, are held back and released with the records once per interval.
+        """
+        self.hot_keys.tick()
+        if self.debouncer is None:
+            for rec in records:
+                self.hot_keys.add(hot_key_id(rec))
+            return records
+        write = []
+        for rec in records:
+            key = hot_key_id(rec)
+            self.hot_keys.add(key)
+            if key in self.debouncer or self.hot_keys.is_hot(key):
+                self.debouncer.hold(key, rec)
+            else:
+                write.append(rec)
+        if self.debouncer.due():
+            write.extend(self.debouncer.release())
+        return write
+
+    def flush_debounced(self):
+        """Write held records for hot keys if the interval has passed, or unconditionally when shutting down."""
+        if self.debouncer is None or not (self.shutdown and len(self.debouncer) or self.debouncer.due()):
+            return []
+        return self.apply_records(self.coalesce(self.debouncer.release()))
+
+    def apply_records(self, records: list):
+        """Apply records to the target, split by key across the current number of writers.
+
+        All records for a key go to the same writer, so are applied in order.
+        """
+        writers = min(self.writers.value, len(records))
+        if writers <= 1 or self.write_executor is None:
+            return self.target.apply(records)
+        parts = [[] for _ in range(writers)]
+        for i, rec in enumerate(records):
+            parts[zlib.crc32(rec.key, zlib.crc32(rec.bucket)) % writers].append(i)
+        parts = [part for part in parts if part]
+        futures = [self.write_executor.submit(self.target.apply, [records[i] for i in part]) for part in parts]
+        results = [None] * len(records)
+        for part, future in zip(parts, futures):
+            for i, result in zip(part, future.result()):
+                results[i] = result
+        return results
+
+    def fetch_records(self):
+        """Fetch from the queue with the current number of fetchers.
+
+        Returns the records fetched and the first error raised, so records
+        fetched alongside a failed request are not lost.
+        """
+        if self.fetchers.value <= 1 or self.fetch_executor is None:
+            try:
+                return [self.sink.fetch(trace=self.tracer.start())], None
+            except Exception as e:
+                return [], e
+        futures = [self.fetch_executor.submit(self.sink.fetch, trace=self.tracer.start())
+            for _ in range(self.fetchers.value)]
+        records = []
+        error = None
+        for future in futures:
+            try:
+                records.append(future.result())
+            except Exception as e:
+                if error is None:
+                    error = e
+        return records, error
+
+    def process_record(self, rec: ReplRecord):
+        return self.process_records([rec])
 
     def signal_handler(self, sign_num, frame):
         self.shutdown = True
 
     def main(self):
+        self.start_time = time.monotonic()
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGUSR1, self.profiler.start_cpu)
+        signal.signal(signal.SIGUSR2, self.profiler.start_memory)
+
+        self.setup()
 
-        self.sink = self.setup_riak_sink()
-        self.table = self.setup_dynamodb_table()
+        if os.getenv('BULK_LOAD', 'false').lower() == 'true':
+            self.bulk_load()
 
+        self.setup_autoscaling()
         self.logger.info("Starting consume from queue")
 
         riak_failure = False
+        batch = []
         while not self.shutdown:
-            try:
-                rec = self.sink.fetch()
-            except HTTPError as e:
-                self.logger.error(e)
+            records, error = self.fetch_records()
+            empty = False
+            for rec in records:
+                if rec.empty:
+                    empty = True
+                    continue
+                if self.first_record_time is None:
+                    self.first_record_time = time.monotonic()
+                    self.logger.info(f"Time to first record {self.first_record_time - self.start_time:.3f} seconds")
+                batch.append(rec)
+            if isinstance(error, HTTPError):
+                self.logger.error(error)
+                if batch:
+                    self.process_records(batch)
+                    batch = []
                 self.logger.warning("Riak failure, backing off for 5 seconds")
                 riak_failure = True
                 time.sleep(5)
-            except Exception as e:
-                self.logger.warning(e)
             else:
-                if riak_failure:
+                if error is not None:
+                    self.logger.warning(error)
+                elif riak_failure:
                     self.logger.info("Recovered from Riak failure")
                     riak_failure = False
-                if not rec.empty:
-                    self.process_record(rec)
-                if rec.empty:
+                if batch and (empty or len(batch) >= self.batch_size):
+                    self.process_records(batch)
+                    batch = []
+                if empty:
                     time.sleep(0.1)
+            self.flush_debounced()
+            self.profiler.poll()
+            if time.monotonic() - self.stats_time >= self.stats_interval:
+                self.stats_time = time.monotonic()
+                self.log_stats()
 
+        if batch:
+            self.process_records(batch)
+        self.flush_debounced()
+        if self.monitor is not None:
+            self.monitor.close()
+        for executor in (self.fetch_executor, self.write_executor):
+            if executor is not None:
+                executor.shutdown()
+        self.target.close()
+        if self.hydrator is not None:
+            self.hydrator.close()
+        if self.metrics is not None:
+            self.metrics.close()
         self.logger.info("Safe shutdown, goodbye.")
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+
+def _total(value):
+    if isinstance(value, dict):
+        return sum(_total(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_total(v) for v in value)
+    return int(value)
+
+def queue_length(stats: dict, stat: str, queue: str):
+    """Extract the length of queue from a Riak stats document.
+
+    The stat may hold the length directly, or map queue names to lengths,
+    in which case lengths split by priority are summed.
+    """
+    value = stats.get(stat)
+    if isinstance(value, dict):
+        value = value.get(queue)
+    if value is None:
+        raise ValueError(f"No length for queue {queue} in stat {stat}")
+    return _total(value)
+
+class QueueMonitor:
+    """Polls Riak's stats for the length of the replication queue from a background thread.
+
+    Samples over the last window seconds give the drain rate, the net number
+    of records leaving the queue per second, and from it the estimated time
+    to catch up. on_sample is called with the monitor after every poll.
+    """
+
+    def __init__(self, fetch_stats, queue: str, logger, stat: str, interval: float = 10.0,
+            window: float = 60.0, on_sample=None):
+        self.fetch_stats = fetch_stats
+        self.queue = queue
+        self.logger = logger
+        self.stat = stat
+        self.interval = interval
+        self.window = window
+        self.on_sample = on_sample
+        self.error_count = 0
+        self._samples = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='queue-monitor', daemon=True)
+
+    def add_sample(self, length: int, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._samples.append((now, length))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+
+    def poll(self):
+        try:
+            length = queue_length(self.fetch_stats(), self.stat, self.queue)
+        except Exception as e:
+            self.error_count += 1
+            self.logger.warning(f"Polling queue length failed: {e}")
+            return None
+        self.add_sample(length)
+        if self.on_sample is not None:
+            self.on_sample(self)
+        return length
+
+    @property
+    def length(self):
+        with self._lock:
+            return self._samples[-1][1] if self._samples else None
+
+    @property
+    def drain_rate(self):
+        with self._lock:
+            if len(self._samples) < 2:
+                return None
+            (start, start_length), (end, end_length) = self._samples[0], self._samples[-1]
+        return (start_length - end_length) / (end - start) if end > start else None
+
+    @property
+    def eta(self):
+        """Estimated seconds until the queue is empty, inf if it is not draining, None if unknown."""
+        length = self.length
+        if length == 0:
+            return 0.0
+        drain_rate = self.drain_rate
+        if length is None or drain_rate is None:
+            return None
+        return length / drain_rate if drain_rate > 0 else float('inf')
+
+    def stats(self):
+        return {'length': self.length, 'drain_rate': self.drain_rate, 'eta': self.eta}
+
+    def _run(self):
+        self.poll()
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+
+class ConcurrencyScaler:
+    """Scales a concurrency level between minimum and maximum from the queue backlog.
+
+    Doubles while the queue is above low_water and not expected to drain
+    within catch_up seconds, and steps down by one once it is at or below
+    low_water, holding otherwise.
+    """
+
+    def __init__(self, name: str, minimum: int, maximum: int, logger, catch_up: float = 60.0, low_water: int = 0):
+        if not 1 <= minimum <= maximum:
+            raise ValueError(f"Invalid {name} concurrency limits min={minimum} max={maximum}")
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.logger = logger
+        self.catch_up = catch_up
+        self.low_water = low_water
+        self.value = minimum
+
+    def update(self, length: int, eta: float):
+        if length is None:
+            return self.value
+        if length <= self.low_water:
+            value = max(self.minimum, self.value - 1)
+        elif eta is None or eta > self.catch_up:
+            value = min(self.maximum, self.value * 2)
+        else:
+            value = self.value
+        if value != self.value:
+            eta_text = 'unknown' if eta is None else f"{eta:.0f}s"
+            self.logger.info(f"Scaling {self.name} from {self.value} to {value}, queue length={length} eta={eta_text}")
+            self.value = value
+        return value
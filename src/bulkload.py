@@ -0,0 +1,188 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from riakhttp import RiakHttpClient, object_record
+
+BATCH_WRITE_MAX_ITEMS = 25
+
+class BulkLoader:
+    """Seeds an empty table with every object in a Riak bucket.
+
+    Keys are streamed from Riak and objects fetched concurrently, keeping at
+    most max_pending fetches in flight, while items are written with
+    unconditional BatchWriteItem requests of 25 paced by the app's rate
+    limiter. The time the load started is recorded as the handover point:
+    everything changed after it is still on the replication queue and is
+    applied by the normal conditional consumer afterwards.
+    """
+
+    def __init__(self, app, riak: RiakHttpClient, bucket: str, bucket_type: str = None,
+            workers: int = 16, max_pending: int = None, marker_path: str = None):
+        self.app = app
+        self.riak = riak
+        self.bucket = bucket
+        self.bucket_type = bucket_type
+        self.workers = workers
+        self.max_pending = max_pending or workers * 8
+        self.marker_path = marker_path
+        self.started_at = None
+        self.key_count = 0
+        self.loaded_count = 0
+        self.skipped_count = 0
+        self.log_every = 10000
+        self._next_log = self.log_every
+
+    def is_empty(self):
+        response = self.app.table.scan(Limit=1, ProjectionExpression='pkey')
+        return not response['Items']
+
+    def read_marker(self):
+        if self.marker_path is None:
+            return None
+        try:
+            with open(self.marker_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _fetch(self, key: str):
+        obj = self.riak.get_object(self.bucket, key, self.bucket_type)
+        if obj is None:
+            return None
+        return object_record(self.bucket, key, obj, self.bucket_type)
+
+    def _item(self, key: str, future):
+        try:
+            rec = future.result()
+        except Exception as e:
+            self.app.logger.error(f"Bulk load fetch for key={key} failed: {e}")
+            return None
+        if rec is None or rec.content_type != b'application/json':
+            return None
+        try:
+            return self.app.target.build_item(key, rec)
+        except Exception as e:
+            self.app.logger.error(f"Bulk load for key={key} failed: {e}")
+            return None
+
+    def _batch_write(self, requests: list):
+        table = self.app.table
+        response = table.meta.client.batch_write_item(RequestItems={table.name: requests})
+        return response.get('UnprocessedItems', {}).get(table.name, [])
+
+    def write_items(self, items: list):
+        """Write items with BatchWriteItem, retrying any left unprocessed through the rate limiter.
+
+        DynamoDB returns items throttled within a batch as UnprocessedItems
+        rather than raising, so these cut the write rate like a throttled request.
+        If the batch fails for any other reason, e.g. an item over the size
+        limit, the items not yet written are logged and skipped.
+        """
+        key = items[0]['pkey']
+        requests = [{'PutRequest': {'Item': item}} for item in items]
+        try:
+            while requests:
+                requests = self.app.target.write("BatchWrite", key, self._batch_write,
+                    tokens=len(requests), requests=requests)
+                if requests:
+                    self.app.limiter.on_throttle()
+                    self.app.logger.warning(f"BatchWrite for key={key} left {len(requests)} items unprocessed, "
+                        f"write rate now {self.app.limiter.rate:.1f}/s")
+        except Exception as e:
+            self.app.logger.error(f"BatchWrite for key={key} failed, skipping {len(requests)} items: {e}")
+            self.skipped_count += len(requests)
+        self.loaded_count += len(items) - len(requests)
+
+    def write_marker(self, finished: bool):
+        if self.marker_path is None:
+            return
+        with open(self.marker_path, 'w') as f:
+            json.dump({
+                'bucket': self.bucket,
+                'bucket_type': self.bucket_type,
+                'started_at': self.started_at,
+                'finished': finished,
+                'keys': self.key_count,
+                'loaded': self.loaded_count,
+                'skipped': self.skipped_count,
+            }, f)
+
+    def _drain(self, pending: deque, items: list):
+        key, future = pending.popleft()
+        item = self._item(key, future)
+        if item is None:
+            self.skipped_count += 1
+            return
+        items.append(item)
+        if len(items) >= BATCH_WRITE_MAX_ITEMS:
+            self.write_items(items)
+            items.clear()
+            if self.loaded_count >= self._next_log:
+                self._next_log += self.log_every
+                self.app.logger.info(f"Bulk loaded {self.loaded_count} items")
+
+    def load(self, force: bool = False):
+        """Load the bucket, returning the time the load started.
+
+        Unless forced, the load is skipped, returning None, if the marker
+        records a finished load, or there is no marker and the table is not
+        empty, so the app can be restarted with bulk load still enabled. A
+        marker recording an unfinished load raises, as the table is only
+        partly loaded. The load stops early, returning None, if the app is
+        shutting down.
+        """
+        if not force:
+            marker = self.read_marker()
+            if marker is not None and marker.get('finished'):
+                self.app.logger.info(f"Bulk load of bucket={self.bucket} already finished, "
+                    f"started at {marker.get('started_at')}, skipping")
+                return None
+            if marker is not None:
+                raise RuntimeError(f"Bulk load of bucket={self.bucket} started at {marker.get('started_at')} "
+                    f"did not finish, set BULK_LOAD_FORCE=true to load it again")
+            if not self.is_empty():
+                self.app.logger.warning(f"Table {self.app.table.name} is not empty, skipping bulk load")
+                return None
+        self.started_at = time.time()
+        self.write_marker(False)
+        self.app.logger.info(f"Starting bulk load of bucket={self.bucket} at {self.started_at}")
+
+        start = time.monotonic()
+        pending = deque()
+        items = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulkload') as executor:
+            for key in self.riak.stream_keys(self.bucket, self.bucket_type):
+                if self.app.shutdown:
+                    break
+                self.key_count += 1
+                pending.append((key, executor.submit(self._fetch, key)))
+                if len(pending) >= self.max_pending:
+                    self._drain(pending, items)
+            while pending and not self.app.shutdown:
+                self._drain(pending, items)
+            for _, future in pending:
+                future.cancel()
+        if self.app.shutdown:
+            self.write_marker(False)
+            self.app.logger.warning(f"Bulk load interrupted by shutdown after keys={self.key_count} "
+                f"loaded={self.loaded_count} skipped={self.skipped_count}")
+            return None
+        if items:
+            self.write_items(items)
+
+        self.write_marker(True)
+        self.app.logger.info(f"Bulk load finished keys={self.key_count} loaded={self.loaded_count} "
+            f"skipped={self.skipped_count} in {time.monotonic() - start:.3f} seconds, "
+            f"handing over to queue from {self.started_at}")
+        return self.started_at
+
+def setup_bulk_loader(app):
+    host = os.getenv('RIAK_HOST', 'localhost')
+    port = int(os.getenv('RIAK_PORT', '8098'))
+    workers = int(os.getenv('BULK_LOAD_WORKERS', '16'))
+    return BulkLoader(app, RiakHttpClient(host, port, maxsize=workers), app.bucket_filter,
+        bucket_type=os.getenv('RIAK_BUCKET_TYPE'),
+        workers=workers,
+        marker_path=os.getenv('BULK_LOAD_MARKER'))
@@ -0,0 +1,175 @@
+import heapq
+import threading
+import time
+from array import array
+from hashlib import blake2b
+from record import VectorClock
+
+def hot_key_id(rec):
+    """Return the bucket type, bucket and key of a record as a single string."""
+    parts = (rec.bucket, rec.key) if rec.bucket_type is None else (rec.bucket_type, rec.bucket, rec.key)
+    return b'/'.join(parts).decode('utf-8', 'replace')
+
+class CountMinSketch:
+    """Approximate counts of items in depth rows of width counters.
+
+    Counts are never underestimated, and overestimated by at most
+    e/width of the total count with probability 1 - exp(-depth).
+    """
+
+    __slots__ = ('width', 'depth', '_rows')
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        if width < 1 or not 1 <= depth <= 8:
+            raise ValueError(f"Invalid sketch dimensions width={width} depth={depth}")
+        self.width = width
+        self.depth = depth
+        self._rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, item: str):
+        # double hashing: row i uses h1 + i * h2
+        digest = blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item: str, count: int = 1):
+        """Count item, returning its new estimated count."""
+        estimate = None
+        for row, i in zip(self._rows, self._indexes(item)):
+            row[i] += count
+            if estimate is None or row[i] < estimate:
+                estimate = row[i]
+        return estimate
+
+    def estimate(self, item: str):
+        return min(row[i] for row, i in zip(self._rows, self._indexes(item)))
+
+    def decay(self):
+        """Halve every counter, so old traffic counts for less."""
+        for n, row in enumerate(self._rows):
+            self._rows[n] = array('Q', (c >> 1 for c in row))
+
+class HotKeyTracker:
+    """Tracks the k keys with the highest estimated counts in a count-min sketch.
+
+    The top keys are kept in a dict alongside a min-heap which may hold stale
+    entries for keys whose counts have since grown, so updating a key already
+    in the top k is a push and evicting the smallest pops stale entries first.
+    Memory is bounded by the sketch size and k. Counts are halved every
+    decay_interval seconds so the top keys follow current traffic. A key is
+    hot if it is in the top k with at least min_count. Safe to share between
+    threads, e.g. the reconciler's repair workers.
+    """
+
+    def __init__(self, k: int = 20, width: int = 2048, depth: int = 4, min_count: int = 100,
+            decay_interval: float = 60.0):
+        if k < 1:
+            raise ValueError(f"Invalid number of hot keys {k}")
+        self.k = k
+        self.min_count = min_count
+        self.decay_interval = decay_interval
+        self.sketch = CountMinSketch(width, depth)
+        self.count = 0
+        self._top = {}
+        self._heap = []
+        self._decay_at = time.monotonic() + decay_interval
+        self._lock = threading.Lock()
+
+    def _push(self, item: str, estimate: int):
+        self._top[item] = estimate
+        heapq.heappush(self._heap, (estimate, item))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(v, k) for k, v in self._top.items()]
+            heapq.heapify(self._heap)
+
+    def add(self, item: str):
+        with self._lock:
+            self.count += 1
+            estimate = self.sketch.add(item)
+            if item in self._top or len(self._top) < self.k:
+                self._push(item, estimate)
+                return estimate
+            while self._heap[0][0] != self._top.get(self._heap[0][1]):
+                heapq.heappop(self._heap)
+            if estimate > self._heap[0][0]:
+                del self._top[heapq.heappop(self._heap)[1]]
+                self._push(item, estimate)
+            return estimate
+
+    def is_hot(self, item: str):
+        with self._lock:
+            return self._top.get(item, 0) >= self.min_count
+
+    def top(self, n: int = None):
+        """Return up to n of the top keys and their estimated counts, highest first."""
+        with self._lock:
+            items = list(self._top.items())
+        return sorted(items, key=lambda kv: kv[1], reverse=True)[:n]
+
+    def tick(self, now: float = None):
+        """Decay the counts if decay_interval has passed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._decay_at:
+                return False
+            self._decay_at = now + self.decay_interval
+            self.sketch.decay()
+            self._top = {k: v >> 1 for k, v in self._top.items() if v > 1}
+            self._heap = [(v, k) for k, v in self._top.items()]
+            heapq.heapify(self._heap)
+            return True
+
+class Debouncer:
+    """Holds records for hot keys and releases them once per interval.
+
+    Held versions superseded by a later one are dropped as they arrive, so
+    only the latest version of each key, or its concurrent siblings, is written.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.held_count = 0
+        self.superseded_count = 0
+        self._pending = {}
+        self._release_at = time.monotonic() + interval
+
+    def __contains__(self, item: str):
+        return item in self._pending
+
+    def __len__(self):
+        return sum(len(versions) for versions in self._pending.values())
+
+    def hold(self, item: str, rec):
+        if not self._pending:
+            self._release_at = time.monotonic() + self.interval
+        self.held_count += 1
+        versions = self._pending.setdefault(item, [])
+        clocks = rec.vector_clocks
+        if not isinstance(clocks, VectorClock):
+            self.superseded_count += len(versions)
+            versions[:] = [rec]
+            return
+        kept = []
+        for held in versions:
+            if isinstance(held.vector_clocks, VectorClock) and held.vector_clocks.descends(clocks):
+                self.superseded_count += 1
+                return
+            if isinstance(held.vector_clocks, VectorClock) and not clocks.descends(held.vector_clocks):
+                kept.append(held)
+            else:
+                self.superseded_count += 1
+        kept.append(rec)
+        self._pending[item] = kept
+
+    def due(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        return bool(self._pending) and now >= self._release_at
+
+    def release(self, now: float = None):
+        """Return all held records, oldest key first, and restart the interval."""
+        now = time.monotonic() if now is None else now
+        self._release_at = now + self.interval
+        records = [rec for versions in self._pending.values() for rec in versions]
+        self._pending = {}
+        return records
@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from record import VectorClock
+from riakhttp import RiakHttpClient
+
+class Hydrator:
+    """Fills in the values of head-only records by fetching the objects from Riak.
+
+    Fetches run concurrently over the client's shared keep-alive pool and a
+    key already being fetched, by this batch or a concurrent one, is only
+    fetched once.
+    """
+
+    def __init__(self, riak: RiakHttpClient, logger, workers: int = 8):
+        self.riak = riak
+        self.logger = logger
+        self.hydrated_count = 0
+        self.failed_count = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hydrate')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def needs_hydration(rec):
+        return rec.head_only and not rec.is_delete
+
+    @staticmethod
+    def _object_id(rec):
+        bucket_type = rec.bucket_type.decode('utf-8') if rec.bucket_type is not None else None
+        return (bucket_type, rec.bucket.decode('utf-8'), rec.key.decode('utf-8'))
+
+    def _fetch(self, object_id):
+        bucket_type, bucket, key = object_id
+        try:
+            return self.riak.get_object(bucket, key, bucket_type)
+        finally:
+            with self._lock:
+                del self._inflight[object_id]
+
+    def _submit(self, object_id):
+        with self._lock:
+            future = self._inflight.get(object_id)
+            if future is None:
+                future = self._executor.submit(self._fetch, object_id)
+                self._inflight[object_id] = future
+            return future
+
+    def _apply(self, rec, obj):
+        rec.value = obj['value']
+        rec.head_only = False
+        rec.meta[b'content-type'] = obj['content_type']
+        # the fetched version may be newer than the head, so take its clocks and timestamp together
+        if isinstance(rec.vector_clocks, VectorClock):
+            rec.vector_clocks = VectorClock(obj['vector_clocks'])
+        else:
+            rec.vector_clocks = obj['vector_clocks']
+        rec.last_modified = obj['last_modified']
+
+    def hydrate(self, records: list):
+        """Hydrate any head-only records in place, leaving head_only set on those which could not be fetched."""
+        pending = [(rec, self._submit(self._object_id(rec))) for rec in records if self.needs_hydration(rec)]
+        for rec, future in pending:
+            key = rec.key.decode('utf-8')
+            try:
+                obj = future.result()
+            except Exception as e:
+                self.failed_count += 1
+                self.logger.error(f"Hydration for key={key} failed: {e}")
+                continue
+            if obj is None:
+                self.failed_count += 1
+                self.logger.warning(f"Hydration for key={key} failed, object no longer in Riak")
+                continue
+            self._apply(rec, obj)
+            self.hydrated_count += 1
+        return len(pending)
+
+    def close(self):
+        self._executor.shutdown()
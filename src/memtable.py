@@ -0,0 +1,429 @@
+import copy
+import random
+import re
+import threading
+import time
+import zlib
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+class MemoryTableError(ClientError):
+    """Base class for errors raised by MemoryTable, shaped like botocore ClientError."""
+
+    code = "InternalServerError"
+
+    def __init__(self, message: str, operation_name: str):
+        super().__init__({'Error': {'Code': self.code, 'Message': message}}, operation_name)
+
+class ConditionalCheckFailedException(MemoryTableError):
+    code = "ConditionalCheckFailedException"
+
+class ProvisionedThroughputExceededException(MemoryTableError):
+    code = "ProvisionedThroughputExceededException"
+
+class ResourceNotFoundException(MemoryTableError):
+    code = "ResourceNotFoundException"
+
+class _Exceptions:
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    ProvisionedThroughputExceededException = ProvisionedThroughputExceededException
+    ResourceNotFoundException = ResourceNotFoundException
+    ClientError = ClientError
+
+class _Client:
+    """Low level client for a MemoryTable, like the table resource's meta.client."""
+
+    exceptions = _Exceptions
+
+    def __init__(self, table):
+        self._table = table
+
+    def _check_table(self, table_name: str, operation_name: str):
+        if table_name != self._table.name:
+            raise ResourceNotFoundException(f"Requested resource not found: Table: {table_name} not found", operation_name)
+
+    def put_item(self, TableName: str, **kwargs):
+        self._check_table(TableName, 'PutItem')
+        return self._table.put_item(**kwargs)
+
+    def delete_item(self, TableName: str, **kwargs):
+        self._check_table(TableName, 'DeleteItem')
+        return self._table.delete_item(**kwargs)
+
+    def scan(self, TableName: str, **kwargs):
+        self._check_table(TableName, 'Scan')
+        return self._table.scan(**kwargs)
+
+    def batch_write_item(self, RequestItems: dict, **kwargs):
+        """Apply puts and deletes, returning throttled requests as UnprocessedItems like DynamoDB.
+
+        Raises ProvisionedThroughputExceededException only if every request is throttled.
+        """
+        count = sum(len(requests) for requests in RequestItems.values())
+        if count > 25:
+            raise MemoryTableError("Too many items requested for the BatchWriteItem call", 'BatchWriteItem')
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            self._check_table(table_name, 'BatchWriteItem')
+            for request in requests:
+                try:
+                    if 'PutRequest' in request:
+                        self._table.put_item(Item=request['PutRequest']['Item'])
+                    else:
+                        self._table.delete_item(Key=request['DeleteRequest']['Key'])
+                except ProvisionedThroughputExceededException:
+                    unprocessed.setdefault(table_name, []).append(request)
+        if count and sum(len(r) for r in unprocessed.values()) == count:
+            raise ProvisionedThroughputExceededException(
+                "The level of configured provisioned throughput for the table was exceeded", 'BatchWriteItem')
+        return {'UnprocessedItems': unprocessed}
+
+class _Meta:
+
+    def __init__(self, client):
+        self.client = client
+
+_TOKEN_RE = re.compile(r"\s*(?:(<>|<=|>=|=|<|>)|([(),.\[\]])|(:[A-Za-z0-9_]+)|(#?[A-Za-z0-9_]+))")
+_MISSING = object()
+
+class ConditionExpression:
+    """Compiled DynamoDB condition expression.
+
+    Supports the subset of the condition grammar used by the replicator:
+    comparators (= <> < <= > >=), BETWEEN, AND/OR/NOT, parentheses and the
+    functions attribute_exists, attribute_not_exists and begins_with over
+    document paths with #name placeholders, map dereferences and list indexes.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self._tokens = self._tokenize(expression)
+        self._pos = 0
+        self._ast = self._parse_or()
+        if self._pos != len(self._tokens):
+            raise ValueError(f"Unexpected token {self._tokens[self._pos]} in condition expression")
+        del self._tokens
+
+    @staticmethod
+    def _tokenize(expression: str):
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            m = _TOKEN_RE.match(expression, pos)
+            if not m:
+                raise ValueError(f"Invalid condition expression at position {pos}: {expression}")
+            tokens.append(m.group(m.lastindex))
+            pos = m.end()
+        return tokens
+
+    def _peek(self):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next(self):
+        tok = self._peek()
+        if tok is None:
+            raise ValueError(f"Unexpected end of condition expression: {self.expression}")
+        self._pos += 1
+        return tok
+
+    def _expect(self, tok: str):
+        got = self._next()
+        if got != tok:
+            raise ValueError(f"Expected {tok} but got {got} in condition expression")
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() is not None and self._peek().upper() == 'OR':
+            self._next()
+            node = ('or', node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() is not None and self._peek().upper() == 'AND':
+            self._next()
+            node = ('and', node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        if self._peek() is not None and self._peek().upper() == 'NOT':
+            self._next()
+            return ('not', self._parse_not())
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        tok = self._peek()
+        if tok == '(':
+            self._next()
+            node = self._parse_or()
+            self._expect(')')
+            return node
+        if tok in ('attribute_exists', 'attribute_not_exists'):
+            self._next()
+            self._expect('(')
+            path = self._parse_path()
+            self._expect(')')
+            return (tok, path)
+        if tok == 'begins_with':
+            self._next()
+            self._expect('(')
+            path = self._parse_operand()
+            self._expect(',')
+            prefix = self._parse_operand()
+            self._expect(')')
+            return ('begins_with', path, prefix)
+
+        left = self._parse_operand()
+        op = self._next()
+        if op.upper() == 'BETWEEN':
+            low = self._parse_operand()
+            if self._next().upper() != 'AND':
+                raise ValueError("BETWEEN requires AND")
+            high = self._parse_operand()
+            return ('between', left, low, high)
+        if op not in ('=', '<>', '<', '<=', '>', '>='):
+            raise ValueError(f"Invalid comparator {op} in condition expression")
+        return ('cmp', op, left, self._parse_operand())
+
+    def _parse_operand(self):
+        if self._peek() is not None and self._peek().startswith(':'):
+            return ('value', self._next())
+        return self._parse_path()
+
+    def _parse_path(self):
+        elements = [self._next()]
+        while self._peek() in ('.', '['):
+            if self._next() == '.':
+                elements.append(self._next())
+            else:
+                elements.append(int(self._next()))
+                self._expect(']')
+        return ('path', tuple(elements))
+
+    def evaluate(self, item: dict, names: dict, values: dict):
+        return self._eval(self._ast, item or {}, names or {}, values or {})
+
+    def _resolve(self, operand, item, names, values):
+        if operand[0] == 'value':
+            try:
+                return values[operand[1]]
+            except KeyError:
+                raise ValueError(f"Value {operand[1]} not defined in ExpressionAttributeValues")
+        current = item
+        for element in operand[1]:
+            if isinstance(element, int):
+                if not isinstance(current, list) or element >= len(current):
+                    return _MISSING
+                current = current[element]
+                continue
+            if element.startswith('#'):
+                try:
+                    element = names[element]
+                except KeyError:
+                    raise ValueError(f"Name {element} not defined in ExpressionAttributeNames")
+            if not isinstance(current, dict) or element not in current:
+                return _MISSING
+            current = current[element]
+        return current
+
+    def _eval(self, node, item, names, values):
+        op = node[0]
+        if op == 'or':
+            return self._eval(node[1], item, names, values) or self._eval(node[2], item, names, values)
+        if op == 'and':
+            return self._eval(node[1], item, names, values) and self._eval(node[2], item, names, values)
+        if op == 'not':
+            return not self._eval(node[1], item, names, values)
+        if op == 'attribute_exists':
+            return self._resolve(node[1], item, names, values) is not _MISSING
+        if op == 'attribute_not_exists':
+            return self._resolve(node[1], item, names, values) is _MISSING
+        if op == 'begins_with':
+            val = self._resolve(node[1], item, names, values)
+            prefix = self._resolve(node[2], item, names, values)
+            return isinstance(val, (str, bytes)) and type(val) is type(prefix) and val.startswith(prefix)
+        if op == 'between':
+            val, low, high = (self._resolve(n, item, names, values) for n in node[1:])
+            return self._compare('>=', val, low) and self._compare('<=', val, high)
+        return self._compare(node[1],
+            self._resolve(node[2], item, names, values),
+            self._resolve(node[3], item, names, values))
+
+    @staticmethod
+    def _compare(op, left, right):
+        if left is _MISSING or right is _MISSING:
+            return False
+        numeric = (int, float, Decimal)
+        if isinstance(left, bool) or isinstance(right, bool) or not (
+                (isinstance(left, numeric) and isinstance(right, numeric)) or type(left) is type(right)):
+            return op == '<>'
+        if op == '=':
+            return left == right
+        if op == '<>':
+            return left != right
+        try:
+            if op == '<':
+                return left < right
+            if op == '<=':
+                return left <= right
+            if op == '>':
+                return left > right
+            return left >= right
+        except TypeError:
+            return False
+
+class MemoryTable:
+    """In-memory stand-in for a boto3 DynamoDB Table resource.
+
+    Implements the parts of the Table API used by App (load, put_item,
+    get_item, delete_item, scan and meta.client.batch_write_item) including condition
+    expression evaluation, and can inject per-call latency and throttling so
+    the app can be exercised without DynamoDB Local.
+
+    Arguments:
+        table_name -- name reported by the table
+        hash_key -- name of the partition key attribute
+        latency -- seconds to sleep on every call
+        jitter -- maximum random seconds added to latency
+        throttle_rate -- probability [0, 1] that a write is throttled
+        write_capacity -- writes per second before requests are throttled, None for unlimited
+        seed -- seed for the random number generator used for jitter/throttling
+    """
+
+    def __init__(self, table_name: str = "test", hash_key: str = "pkey", latency: float = 0.0,
+            jitter: float = 0.0, throttle_rate: float = 0.0, write_capacity: float = None, seed=None):
+        self.name = table_name
+        self.meta = _Meta(_Client(self))
+        self.hash_key = hash_key
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.write_capacity = write_capacity
+        self.throttled_count = 0
+        self.write_count = 0
+        self._items = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._conditions = {}
+        self._capacity_tokens = write_capacity or 0.0
+        self._capacity_time = time.monotonic()
+
+    def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _consume_write_capacity(self):
+        if self.write_capacity is None:
+            return True
+        now = time.monotonic()
+        self._capacity_tokens = min(self.write_capacity,
+            self._capacity_tokens + (now - self._capacity_time) * self.write_capacity)
+        self._capacity_time = now
+        if self._capacity_tokens < 1:
+            return False
+        self._capacity_tokens -= 1
+        return True
+
+    def _check_throttle(self, operation_name: str):
+        throttled = self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+        if throttled or not self._consume_write_capacity():
+            self.throttled_count += 1
+            raise ProvisionedThroughputExceededException(
+                "The level of configured provisioned throughput for the table was exceeded", operation_name)
+
+    def _get_condition(self, expression: str):
+        condition = self._conditions.get(expression)
+        if condition is None:
+            condition = ConditionExpression(expression)
+            self._conditions[expression] = condition
+        return condition
+
+    def _key_value(self, key: dict, operation_name: str):
+        try:
+            return key[self.hash_key]
+        except (KeyError, TypeError):
+            raise MemoryTableError(f"Missing the key {self.hash_key} in the item", operation_name)
+
+    def _check_condition(self, current, kwargs, operation_name: str):
+        expression = kwargs.get('ConditionExpression')
+        if expression is None:
+            return
+        condition = self._get_condition(expression)
+        if not condition.evaluate(current,
+                kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')):
+            raise ConditionalCheckFailedException("The conditional request failed", operation_name)
+
+    def load(self):
+        pass
+
+    def wait_until_exists(self):
+        pass
+
+    def put_item(self, Item: dict, **kwargs):
+        self._delay()
+        key = self._key_value(Item, 'PutItem')
+        with self._lock:
+            self._check_throttle('PutItem')
+            self._check_condition(self._items.get(key), kwargs, 'PutItem')
+            self._items[key] = copy.deepcopy(Item)
+            self.write_count += 1
+        return {}
+
+    def delete_item(self, Key: dict, **kwargs):
+        self._delay()
+        key = self._key_value(Key, 'DeleteItem')
+        with self._lock:
+            self._check_throttle('DeleteItem')
+            self._check_condition(self._items.get(key), kwargs, 'DeleteItem')
+            self._items.pop(key, None)
+            self.write_count += 1
+        return {}
+
+    def get_item(self, Key: dict, **kwargs):
+        self._delay()
+        key = self._key_value(Key, 'GetItem')
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return {}
+            return {'Item': copy.deepcopy(item)}
+
+    def scan(self, **kwargs):
+        """Scan the table, supporting parallel segments, pagination and top-level projections."""
+        self._delay()
+        segment = kwargs.get('Segment', 0)
+        total_segments = kwargs.get('TotalSegments', 1)
+        if not 0 <= segment < total_segments:
+            raise MemoryTableError(f"Invalid Segment {segment} for TotalSegments {total_segments}", 'Scan')
+        names = kwargs.get('ExpressionAttributeNames', {})
+        projection = kwargs.get('ProjectionExpression')
+        if projection is not None:
+            projection = [names.get(p.strip(), p.strip()) for p in projection.split(',')]
+        start = kwargs.get('ExclusiveStartKey')
+        limit = kwargs.get('Limit')
+
+        with self._lock:
+            keys = sorted(k for k in self._items
+                if zlib.crc32(str(k).encode('utf-8')) % total_segments == segment)
+            if start is not None:
+                start_key = self._key_value(start, 'Scan')
+                keys = [k for k in keys if str(k) > str(start_key)]
+            response = {}
+            if limit is not None and len(keys) > limit:
+                keys = keys[:limit]
+                response['LastEvaluatedKey'] = {self.hash_key: keys[-1]}
+            items = [copy.deepcopy(self._items[k]) for k in keys]
+        if projection is not None:
+            items = [{p: item[p] for p in projection if p in item} for item in items]
+        response['Items'] = items
+        response['Count'] = len(items)
+        return response
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def metric_name(name: str, **labels):
+    """Return a Prometheus metric name with labels, e.g. name{key="value"}."""
+    if not labels:
+        return name
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+def render(metrics: dict):
+    """Render a dict of metric name to value in the Prometheus text format."""
+    return ''.join(f"{name} {format_value(value)}\n" for name, value in metrics.items())
+
+class MetricsServer:
+    """Serves the metrics returned by collect on GET /metrics from a background thread."""
+
+    def __init__(self, port: int, collect, logger, host: str = ''):
+        self.collect = collect
+        self.logger = logger
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(server.collect()).encode('utf-8')
+                except Exception as e:
+                    server.logger.error(f"Collecting metrics failed: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
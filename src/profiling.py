@@ -0,0 +1,133 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+class Profiler:
+    """cProfile and tracemalloc sessions which can be started at runtime.
+
+    start_cpu/start_memory are safe to call from a signal handler. Sessions
+    are stopped by poll, called from the consumer loop, once they have run for
+    duration seconds; results are logged and dumped to output_dir. The CPU
+    profile only covers the thread the signal interrupted, the consumer loop,
+    not the fetch, write or hydration pools.
+    """
+
+    def __init__(self, logger, output_dir: str = "/tmp", duration: float = 30.0, top: int = 20):
+        self.logger = logger
+        self.output_dir = output_dir
+        self.duration = duration
+        self.top = top
+        self._cpu = None
+        self._cpu_deadline = None
+        self._memory_deadline = None
+
+    def start_cpu(self, *args):
+        if self._cpu is not None:
+            return
+        self._cpu = cProfile.Profile()
+        self._cpu_deadline = time.monotonic() + self.duration
+        self._cpu.enable()
+        self.logger.info(f"Started CPU profile for {self.duration} seconds")
+
+    def start_memory(self, *args):
+        if self._memory_deadline is not None:
+            return
+        tracemalloc.start()
+        self._memory_deadline = time.monotonic() + self.duration
+        self.logger.info(f"Started memory profile for {self.duration} seconds")
+
+    def _path(self, kind: str, ext: str):
+        return os.path.join(self.output_dir, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{ext}")
+
+    def stop_cpu(self):
+        """Stop the CPU profile and write it out, logging rather than raising any error."""
+        try:
+            self._cpu.disable()
+            path = self._path("cpu", "prof")
+            self._cpu.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self._cpu, stream=out).sort_stats('cumulative').print_stats(self.top)
+            self.logger.info(f"CPU profile written to {path}\n{out.getvalue()}")
+        except Exception as e:
+            self.logger.error(f"CPU profile failed: {e}")
+        finally:
+            self._cpu = None
+            self._cpu_deadline = None
+
+    def stop_memory(self):
+        """Stop the memory profile and write it out, logging rather than raising any error."""
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            path = self._path("memory", "snapshot")
+            snapshot.dump(path)
+            top = "\n".join(str(stat) for stat in snapshot.statistics('lineno')[:self.top])
+            self.logger.info(f"Memory profile written to {path} current={current} peak={peak}\n{top}")
+        except Exception as e:
+            self.logger.error(f"Memory profile failed: {e}")
+        finally:
+            tracemalloc.stop()
+            self._memory_deadline = None
+
+    def poll(self):
+        now = time.monotonic()
+        if self._cpu_deadline is not None and now >= self._cpu_deadline:
+            self.stop_cpu()
+        if self._memory_deadline is not None and now >= self._memory_deadline:
+            self.stop_memory()
+
+class Trace:
+    """Timings of the stages one record passes through."""
+
+    __slots__ = ('stages', 'start')
+
+    def __init__(self):
+        self.stages = {}
+        self.start = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+def stage(trace, name: str):
+    """Time a stage on trace, or do nothing if the record is not being traced."""
+    if trace is None:
+        return nullcontext()
+    return trace.stage(name)
+
+class StageTracer:
+    """Samples records for per-stage tracing and logs the finished traces.
+
+    Arguments:
+        logger -- logger for finished traces
+        sample_rate -- fraction [0, 1] of fetches to trace
+    """
+
+    def __init__(self, logger, sample_rate: float = 0.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self._random = random.Random()
+
+    def start(self):
+        if self.sample_rate > 0 and self._random.random() < self.sample_rate:
+            return Trace()
+        return None
+
+    def finish(self, rec):
+        trace = rec.trace
+        if trace is None:
+            return
+        stages = " ".join(f"{name}={duration * 1000:.3f}ms" for name, duration in trace.stages.items())
+        total = (time.monotonic() - trace.start) * 1000
+        lag = time.time() - float(rec.last_modified)
+        self.logger.info(f"Trace key={rec.key.decode('utf-8')} {stages} total={total:.3f}ms lag={lag:.3f}s")
+        rec.trace = None
@@ -0,0 +1,146 @@
+import json
+
+RULES = ('keep', 'drop', 'rename', 'flatten', 'separator')
+
+def _split(path: str):
+    if not isinstance(path, str) or not path or any(not part for part in path.split('.')):
+        raise ValueError(f"Invalid projection path {path!r}")
+    return tuple(path.split('.'))
+
+def _get(doc: dict, path: tuple):
+    for part in path:
+        if not isinstance(doc, dict) or part not in doc:
+            raise KeyError(part)
+        doc = doc[part]
+    return doc
+
+def _pop(doc: dict, path: tuple):
+    for part in path[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            raise KeyError(part)
+    return doc.pop(path[-1])
+
+def _set(doc: dict, path: tuple, value):
+    for part in path[:-1]:
+        child = doc.get(part)
+        if not isinstance(child, dict):
+            child = doc[part] = {}
+        doc = child
+    doc[path[-1]] = value
+
+def _flatten_into(out: dict, prefix: str, value: dict, separator: str):
+    for k, v in value.items():
+        name = prefix + separator + k
+        if isinstance(v, dict) and v:
+            _flatten_into(out, name, v, separator)
+        else:
+            out[name] = v
+
+def _keep_step(paths: list):
+    if all(len(path) == 1 for path in paths):
+        names = tuple(path[0] for path in paths)
+        def keep_top_level(doc):
+            return {name: doc[name] for name in names if name in doc}
+        return keep_top_level
+
+    def keep(doc):
+        out = {}
+        for path in paths:
+            try:
+                _set(out, path, _get(doc, path))
+            except KeyError:
+                pass
+        return out
+    return keep
+
+def _drop_step(paths: list):
+    def drop(doc):
+        for path in paths:
+            try:
+                _pop(doc, path)
+            except KeyError:
+                pass
+        return doc
+    return drop
+
+def _rename_step(renames: list):
+    def rename(doc):
+        for source, target in renames:
+            try:
+                value = _pop(doc, source)
+            except KeyError:
+                continue
+            _set(doc, target, value)
+        return doc
+    return rename
+
+def _flatten_step(paths: list, separator: str):
+    def flatten(doc):
+        for path in paths:
+            try:
+                value = _get(doc, path)
+            except KeyError:
+                continue
+            if not isinstance(value, dict):
+                continue
+            _pop(doc, path)
+            _flatten_into(doc, separator.join(path), value, separator)
+        return doc
+    return flatten
+
+def compile_projection(rules: dict):
+    """Compile projection rules into a function from a parsed JSON document to the projected document.
+
+    Rules are applied in the order keep, drop, rename, flatten:
+        keep -- list of dotted paths to keep, everything else is removed
+        drop -- list of dotted paths to remove
+        rename -- mapping of dotted source path to dotted target path
+        flatten -- list of dotted paths to maps whose leaves are moved to the
+            top level, named by joining their path with separator (default "_")
+
+    Returns None if there are no rules, so callers can skip projection entirely.
+    """
+    if not isinstance(rules, dict):
+        raise ValueError("Projection rules must be a mapping")
+    unknown = set(rules) - set(RULES)
+    if unknown:
+        raise ValueError(f"Unknown projection rules {sorted(unknown)}")
+    for rule in ('keep', 'drop', 'flatten'):
+        if not isinstance(rules.get(rule, []), list):
+            raise ValueError(f"Projection rule {rule} must be a list of paths")
+    if not isinstance(rules.get('rename', {}), dict):
+        raise ValueError("Projection rule rename must be a mapping of paths")
+    separator = rules.get('separator', '_')
+    if not isinstance(separator, str):
+        raise ValueError("Projection rule separator must be a string")
+
+    steps = []
+    if rules.get('keep'):
+        steps.append(_keep_step([_split(p) for p in rules['keep']]))
+    if rules.get('drop'):
+        steps.append(_drop_step([_split(p) for p in rules['drop']]))
+    if rules.get('rename'):
+        steps.append(_rename_step([(_split(s), _split(t)) for s, t in rules['rename'].items()]))
+    if rules.get('flatten'):
+        steps.append(_flatten_step([_split(p) for p in rules['flatten']], separator))
+
+    if not steps:
+        return None
+    if len(steps) == 1:
+        return steps[0]
+
+    def project(doc):
+        for step in steps:
+            doc = step(doc)
+        return doc
+    return project
+
+def load_projection(spec: str):
+    """Compile projection rules from a JSON string, or a path to a JSON file if it starts with @."""
+    if not spec:
+        return None
+    if spec.startswith('@'):
+        with open(spec[1:]) as f:
+            spec = f.read()
+    return compile_projection(json.loads(spec))
@@ -0,0 +1,89 @@
+import threading
+import time
+
+THROTTLE_ERROR_CODES = frozenset([
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+])
+
+def is_throttle_error(e: Exception):
+    """Return True if e is a botocore style ClientError caused by throttling."""
+    response = getattr(e, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    return response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate is governed by additive increase/multiplicative decrease.
+
+    Every successful write grows the rate so that it rises by roughly
+    increase writes/second each second, and every throttled write cuts the
+    rate by the decrease factor. Tokens accumulate for at most burst seconds.
+
+    Arguments:
+        rate -- initial writes per second
+        min_rate -- lower bound for the rate
+        max_rate -- upper bound for the rate
+        increase -- additive increase in writes/second per second without throttling
+        decrease -- multiplicative decrease applied on throttling
+        burst -- seconds of tokens the bucket can hold
+    """
+
+    def __init__(self, rate: float = 25.0, min_rate: float = 1.0, max_rate: float = 10000.0,
+            increase: float = 5.0, decrease: float = 0.5, burst: float = 1.0):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError(f"Invalid rate limits min_rate={min_rate} rate={rate} max_rate={max_rate}")
+        if not 0 < decrease < 1:
+            raise ValueError(f"Invalid decrease factor {decrease}")
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.burst = float(burst)
+        self.success_count = 0
+        self.throttle_count = 0
+        self.wait_time = 0.0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float, tokens: float = 1.0):
+        capacity = max(tokens, self.rate * self.burst)
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until tokens are available, return seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic(), tokens)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.wait_time += waited
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self, tokens: float = 1.0):
+        with self._lock:
+            self.success_count += 1
+            self.rate = min(self.max_rate, self.rate + tokens * self.increase / self.rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'success_count': self.success_count,
+                'throttle_count': self.throttle_count,
+                'wait_time': self.wait_time,
+            }
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app import App
+from riakhttp import RiakHttpClient, object_record
+from target import APPLIED, STALE, SKIPPED
+
+def clock_hash(key: str, vector_clocks):
+    """Stable 64 bit hash of a key and its vector clocks, independent of actor order and number type."""
+    h = hashlib.blake2b(key.encode('utf-8'), digest_size=8)
+    if vector_clocks:
+        for actor, counter in sorted(vector_clocks.items()):
+            h.update(f"\0{actor}\0{int(counter)}".encode('utf-8'))
+    return int.from_bytes(h.digest(), 'big')
+
+class ClockTree:
+    """Two level hash tree over keys and their vector clocks.
+
+    Keys are spread over segments by crc32 and segments are grouped into
+    branches. Each segment hash is the XOR of its key hashes and each branch
+    hash the XOR of its segments, so two trees can be compared top down and
+    only the keys in differing segments need to be inspected.
+    """
+
+    def __init__(self, segments: int = 1024, branches: int = 32):
+        if segments % branches != 0:
+            raise ValueError(f"segments={segments} must be a multiple of branches={branches}")
+        self.segments = segments
+        self.branches = branches
+        self._segment_hashes = [0] * segments
+        self._keys = [{} for _ in range(segments)]
+
+    def segment(self, key: str):
+        return zlib.crc32(key.encode('utf-8')) % self.segments
+
+    def add(self, key: str, vector_clocks):
+        segment = self.segment(key)
+        h = clock_hash(key, vector_clocks)
+        previous = self._keys[segment].get(key)
+        if previous is not None:
+            self._segment_hashes[segment] ^= previous
+        self._keys[segment][key] = h
+        self._segment_hashes[segment] ^= h
+
+    def branch_hashes(self):
+        width = self.segments // self.branches
+        hashes = []
+        for b in range(self.branches):
+            h = 0
+            for s in range(b * width, (b + 1) * width):
+                h ^= self._segment_hashes[s]
+            hashes.append(h)
+        return hashes
+
+    def root(self):
+        h = 0
+        for s in self._segment_hashes:
+            h ^= s
+        return h
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys)
+
+    def diff(self, other):
+        """Return the set of keys whose clocks differ between this tree and other."""
+        if (self.segments, self.branches) != (other.segments, other.branches):
+            raise ValueError("Cannot compare trees with different shapes")
+        keys = set()
+        if self.root() == other.root():
+            return keys
+        width = self.segments // self.branches
+        for b, (mine, theirs) in enumerate(zip(self.branch_hashes(), other.branch_hashes())):
+            if mine == theirs:
+                continue
+            for s in range(b * width, (b + 1) * width):
+                if self._segment_hashes[s] == other._segment_hashes[s]:
+                    continue
+                mine_keys = self._keys[s]
+                their_keys = other._keys[s]
+                for key in mine_keys.keys() | their_keys.keys():
+                    if mine_keys.get(key) != their_keys.get(key):
+                        keys.add(key)
+        return keys
+
+class ReconcileResult:
+
+    def __init__(self):
+        self.missing_in_target = set()
+        self.missing_in_riak = set()
+        self.mismatched = set()
+        self.riak_clocks = {}
+        self.target_clocks = {}
+
+    def __len__(self):
+        return len(self.missing_in_target) + len(self.missing_in_riak) + len(self.mismatched)
+
+class Reconciler:
+    """Compare a DynamoDB table against a Riak bucket and repair the keys which differ.
+
+    The table is read with a parallel segmented Scan and Riak clocks are read
+    concurrently over a shared connection pool; both are folded into a
+    ClockTree and only keys in differing segments are compared and repaired.
+    At most max_pending Riak requests are in flight while keys are streamed.
+    """
+
+    def __init__(self, app: App, riak: RiakHttpClient, bucket: str, bucket_type: str = None,
+            scan_segments: int = 4, workers: int = 8, tree_segments: int = 1024, max_pending: int = None):
+        self.app = app
+        self.riak = riak
+        self.bucket = bucket
+        self.bucket_type = bucket_type
+        self.scan_segments = scan_segments
+        self.workers = workers
+        self.tree_segments = tree_segments
+        self.max_pending = max_pending or workers * 8
+
+    def _scan_segment(self, segment: int):
+        clocks = {}
+        kwargs = {
+            'Segment': segment,
+            'TotalSegments': self.scan_segments,
+            'ProjectionExpression': 'pkey, #vclocks, #deleted',
+            'ExpressionAttributeNames': {'#vclocks': '_riak_vclocks', '#deleted': '_riak_deleted'},
+        }
+        while True:
+            # segments are scanned concurrently, so use the thread safe low level client
+            response = self.app.table.meta.client.scan(TableName=self.app.table.name, **kwargs)
+            for item in response['Items']:
+                # tombstones stand for keys which are deleted in Riak too
+                if item.get('_riak_deleted'):
+                    continue
+                clocks[item['pkey']] = item.get('_riak_vclocks')
+            if 'LastEvaluatedKey' not in response:
+                return clocks
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def scan_target(self):
+        clocks = {}
+        with ThreadPoolExecutor(max_workers=self.scan_segments, thread_name_prefix='scan') as executor:
+            for segment_clocks in executor.map(self._scan_segment, range(self.scan_segments)):
+                clocks.update(segment_clocks)
+        return clocks
+
+    @staticmethod
+    def _collect(pending: deque, clocks: dict):
+        key, future = pending.popleft()
+        clock = future.result()
+        if clock is not None:
+            clocks[key] = clock
+
+    def fetch_riak(self):
+        clocks = {}
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='riak') as executor:
+            for key in self.riak.stream_keys(self.bucket, self.bucket_type):
+                pending.append((key, executor.submit(self.riak.head_vector_clocks, self.bucket, key, self.bucket_type)))
+                if len(pending) >= self.max_pending:
+                    self._collect(pending, clocks)
+            while pending:
+                self._collect(pending, clocks)
+        return clocks
+
+    def build_tree(self, clocks: dict):
+        tree = ClockTree(segments=self.tree_segments)
+        for key, vector_clocks in clocks.items():
+            tree.add(key, vector_clocks)
+        return tree
+
+    def compare(self):
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='reconcile') as executor:
+            target_future = executor.submit(self.scan_target)
+            riak_future = executor.submit(self.fetch_riak)
+            target_clocks = target_future.result()
+            riak_clocks = riak_future.result()
+
+        result = ReconcileResult()
+        for key in self.build_tree(riak_clocks).diff(self.build_tree(target_clocks)):
+            if key not in target_clocks:
+                result.missing_in_target.add(key)
+            elif key not in riak_clocks:
+                result.missing_in_riak.add(key)
+            else:
+                result.mismatched.add(key)
+            result.riak_clocks[key] = riak_clocks.get(key)
+            result.target_clocks[key] = target_clocks.get(key)
+        self.app.logger.info(f"Compared riak_keys={len(riak_clocks)} target_keys={len(target_clocks)} "
+            f"missing_in_target={len(result.missing_in_target)} missing_in_riak={len(result.missing_in_riak)} "
+            f"mismatched={len(result.mismatched)}")
+        return result
+
+    def remove_key(self, key: str, vector_clocks: dict):
+        """Remove an item no longer in Riak if it is unchanged since the scan, leaving a tombstone in tombstone mode."""
+        target = self.app.target
+        if target.tombstones:
+            self.app.logger.info(f"Tombstoning item key={key} not in Riak")
+            request = target.put_item
+            kwargs = {'Item': target.make_tombstone(key, vector_clocks, str(time.time()))}
+        else:
+            self.app.logger.info(f"Removing item key={key} not in Riak")
+            request = target.delete_item
+            kwargs = {'Key': {'pkey': key}}
+        try:
+            target.write("Delete", key, request,
+                ConditionExpression="#vclocks = :vclocks",
+                ExpressionAttributeNames={'#vclocks': '_riak_vclocks'},
+                ExpressionAttributeValues={':vclocks': vector_clocks},
+                **kwargs)
+        except self.app.table.meta.client.exceptions.ConditionalCheckFailedException:
+            self.app.logger.warning(f"Delete for key={key} failed due to vector clock mis-match")
+            return STALE
+        return APPLIED
+
+    def repair_key(self, key: str, result: ReconcileResult):
+        """Repair a key, returning APPLIED if it was written."""
+        if key in result.missing_in_riak:
+            return self.remove_key(key, result.target_clocks[key])
+
+        obj = self.riak.get_object(self.bucket, key, self.bucket_type)
+        if obj is None:
+            self.app.logger.warning(f"Key={key} no longer in Riak, skipping")
+            return SKIPPED
+        return self.app.process_record(object_record(self.bucket, key, obj, self.bucket_type))[0]
+
+    def repair(self, result: ReconcileResult):
+        """Repair the keys which differ, returning the number which were not written."""
+        keys = result.missing_in_target | result.missing_in_riak | result.mismatched
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='repair') as executor:
+            futures = [(key, executor.submit(self.repair_key, key, result)) for key in keys]
+            for key, future in futures:
+                try:
+                    repair_result = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.app.logger.error(f"Repair for key={key} failed: {e}")
+                    continue
+                if repair_result != APPLIED:
+                    failed += 1
+                    self.app.logger.error(f"Repair for key={key} failed: {repair_result}")
+        self.app.logger.info(f"Repaired {len(keys) - failed} keys, {failed} failed")
+        return failed
+
+def main():
+    app = App()
+    bucket = os.getenv('RIAK_BUCKET', 'test')
+    app.bucket_filter = bucket
+    workers = int(os.getenv('RECONCILE_WORKERS', '8'))
+    riak = RiakHttpClient(os.getenv('RIAK_HOST', 'localhost'), int(os.getenv('RIAK_PORT', '8098')), maxsize=workers)
+    app.table = app.wait_until_ready("DynamoDB", app.setup_dynamodb_table)
+    reconciler = Reconciler(app, riak, bucket,
+        bucket_type=os.getenv('RIAK_BUCKET_TYPE'),
+        scan_segments=int(os.getenv('RECONCILE_SCAN_SEGMENTS', '4')),
+        workers=workers)
+
+    start = time.monotonic()
+    result = reconciler.compare()
+    if os.getenv('RECONCILE_REPAIR', 'false').lower() == 'true':
+        reconciler.repair(result)
+    app.logger.info(f"Reconciliation finished in {time.monotonic() - start:.3f} seconds")
+
+if __name__ == '__main__':
+    main()
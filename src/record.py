@@ -1,10 +1,151 @@
 import struct
+import sys
 import zlib
 import base64
-import erlang
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
 
 RIAK_MAGIC_NUMBER = 53
 
+_erlang = None
+
+def binary_to_term(data: bytes):
+    """Decode an erlang external term, importing the erlang module on first use."""
+    global _erlang
+    if _erlang is None:
+        import erlang
+        _erlang = erlang
+    return _erlang.binary_to_term(data)
+
+def _vector_clock_pairs(data: bytes):
+    try:
+        erl_term = binary_to_term(data)
+        return [("".join([ str(x) for x in clock[0].binary() ]), clock[1][0]) for clock in erl_term]
+    except:
+        raise ValueError("Could not decode vector clocks")
+
+def decode_vector_clocks(data: bytes):
+    """Decode an erlang term_to_binary encoded vector clock into a dict of actor to counter."""
+    return dict(_vector_clock_pairs(data))
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(data: bytes, offset: int):
+    n = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("truncated vector clock")
+        b = data[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+class VectorClock(Mapping):
+    """Immutable vector clock mapping actor to counter.
+
+    Actors are interned and kept sorted alongside an array of counters, so
+    lookups are a binary search and comparisons a merge of two sorted lists.
+    Being a Mapping it can be used anywhere the dict format was.
+    """
+
+    __slots__ = ('_actors', '_counters')
+
+    def __init__(self, clocks=()):
+        if isinstance(clocks, Mapping):
+            clocks = clocks.items()
+        merged = {}
+        for actor, counter in clocks:
+            actor = sys.intern(str(actor))
+            merged[actor] = max(int(counter), merged.get(actor, 0))
+        self._actors = tuple(sorted(merged))
+        self._counters = array('Q', [merged[a] for a in self._actors])
+
+    @classmethod
+    def decode(cls, data: bytes):
+        """Decode an erlang term_to_binary encoded vector clock."""
+        return cls(_vector_clock_pairs(data))
+
+    def __getitem__(self, actor):
+        i = bisect_left(self._actors, actor)
+        if i < len(self._actors) and self._actors[i] == actor:
+            return self._counters[i]
+        raise KeyError(actor)
+
+    def __iter__(self):
+        return iter(self._actors)
+
+    def __len__(self):
+        return len(self._actors)
+
+    def __repr__(self):
+        return f"VectorClock({dict(self)})"
+
+    def __reduce__(self):
+        return (VectorClock, (list(zip(self._actors, self._counters)),))
+
+    def descends(self, other):
+        """True if self has seen every event in other."""
+        other = _as_vector_clock(other)
+        actors = self._actors
+        n = len(actors)
+        i = 0
+        for actor, counter in zip(other._actors, other._counters):
+            while i < n and actors[i] < actor:
+                i += 1
+            if counter and (i == n or actors[i] != actor or self._counters[i] < counter):
+                return False
+        return True
+
+    def dominates(self, other):
+        """True if self descends other and has seen at least one event other has not."""
+        other = _as_vector_clock(other)
+        return self.descends(other) and not other.descends(self)
+
+    def concurrent(self, other):
+        other = _as_vector_clock(other)
+        return not self.descends(other) and not other.descends(self)
+
+    def merge(self, other):
+        return VectorClock(list(self.items()) + list(other.items()))
+
+    def to_bytes(self):
+        """Compact, stable serialization: a varint count then varint length prefixed actors and varint counters."""
+        out = bytearray()
+        _write_varint(out, len(self._actors))
+        for actor, counter in zip(self._actors, self._counters):
+            encoded = actor.encode('utf-8')
+            _write_varint(out, len(encoded))
+            out += encoded
+            _write_varint(out, counter)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        count, offset = _read_varint(data, 0)
+        pairs = []
+        for _ in range(count):
+            length, offset = _read_varint(data, offset)
+            actor = data[offset:offset + length].decode('utf-8')
+            offset += length
+            counter, offset = _read_varint(data, offset)
+            pairs.append((actor, counter))
+        if offset != len(data):
+            raise ValueError("vector clock too long")
+        return cls(pairs)
+
+def _as_vector_clock(clocks):
+    if isinstance(clocks, VectorClock):
+        return clocks
+    return VectorClock(clocks)
+
 class TooManySiblingsError(Exception):
     """Exception raised for too many siblings in repl record.
 
@@ -23,9 +164,13 @@ class TooManySiblingsError(Exception):
 
 class ReplRecord():
 
+    __slots__ = ('_raw_data', '_vc_format', '_offset', 'meta', 'empty', 'crc', 'is_delete', 'tomb_clock',
+        'compressed', 'bucket_type', 'bucket', 'key', 'vector_clocks', 'siblings_count', 'head_only',
+        'value', 'last_modified', 'vtag', 'key_deleted', 'trace')
+
     def __init__(self, raw_data=None, vc_format: str = "base64"):
         self._raw_data = raw_data
-        if vc_format in ["base64", "dict"]:
+        if vc_format in ["base64", "dict", "vclock"]:
             self._vc_format = vc_format
         else:
             raise ValueError(f"Invalid vector clock format {vc_format}")
@@ -45,11 +190,28 @@ class ReplRecord():
         self.last_modified = None
         self.vtag = None
         self.key_deleted = False
-        self.metadata = []
+        self.meta = {}
+        self.trace = None
 
         self._offset = 0
 
-        self.decode()
+        if raw_data is not None:
+            self.decode()
+
+    @property
+    def metadata(self):
+        """Metadata as a list of single entry dicts, built from the meta mapping on access."""
+        return [{k: v} for k, v in self.meta.items()]
+
+    @metadata.setter
+    def metadata(self, metadata: list):
+        self.meta = {}
+        for entry in metadata:
+            self.meta.update(entry)
+
+    @property
+    def content_type(self):
+        return self.meta.get(b'content-type')
 
     def _extract_value(self, format_string: str):
         try:
@@ -79,7 +241,7 @@ class ReplRecord():
             return val
         else:
             try:
-                return erlang.binary_to_term(val)
+                return binary_to_term(val)
             except Exception as e:
                 raise ValueError(e)
 
@@ -146,14 +308,9 @@ class ReplRecord():
 
         if clock_length != 0:
             if self._vc_format == "dict":
-                try:
-                    erl_term = erlang.binary_to_term(self._extract_str(clock_length))
-                    self.vector_clocks = {}
-                    for clock in erl_term:
-                        actor = "".join([ str(x) for x in clock[0].binary() ])
-                        self.vector_clocks[actor] = clock[1][0]
-                except:
-                    raise ValueError("Could not decode vector clocks")
+                self.vector_clocks = decode_vector_clocks(self._extract_str(clock_length))
+            elif self._vc_format == "vclock":
+                self.vector_clocks = VectorClock.decode(self._extract_str(clock_length))
             else:
                 self.vector_clocks = base64.b64encode(self._extract_str(clock_length))
 
@@ -194,7 +351,7 @@ class ReplRecord():
             val_len = self._extract_uint32()
             val = self._extract_maybe_binary(val_len)
 
-            self.metadata.append({key:val})
+            self.meta[key] = val
 
     def _get_tomb_clock(self):
         tomb_clock_len = self._extract_uint32()
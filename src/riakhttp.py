@@ -0,0 +1,120 @@
+import base64
+import json
+import zlib
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+import urllib3
+from record import ReplRecord, VectorClock, decode_vector_clocks
+
+def decode_http_vector_clocks(header: str):
+    """Decode an X-Riak-Vclock header into a dict of actor to counter.
+
+    Riak's HTTP API encodes vector clocks as base64(zlib:zip(term_to_binary(VClock))).
+    """
+    data = base64.b64decode(header)
+    try:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    except zlib.error:
+        pass
+    return decode_vector_clocks(data)
+
+def object_record(bucket: str, key: str, obj: dict, bucket_type: str = None, vc_format: str = "vclock"):
+    """Build a ReplRecord from an object returned by RiakHttpClient.get_object."""
+    rec = ReplRecord(vc_format=vc_format)
+    rec.empty = False
+    rec.bucket_type = bucket_type.encode('utf-8') if bucket_type is not None else None
+    rec.bucket = bucket.encode('utf-8')
+    rec.key = key.encode('utf-8')
+    rec.value = obj['value']
+    rec.siblings_count = 1
+    if vc_format == "vclock":
+        rec.vector_clocks = VectorClock(obj['vector_clocks'])
+    elif vc_format == "dict":
+        rec.vector_clocks = obj['vector_clocks']
+    else:
+        raise ValueError(f"Unsupported vector clock format {vc_format}")
+    rec.last_modified = obj['last_modified']
+    rec.meta[b'content-type'] = obj['content_type']
+    return rec
+
+class RiakHttpClient:
+    """Client for the parts of Riak's HTTP API used outside the replication queue.
+
+    A single keep-alive connection pool of up to maxsize connections is shared
+    by every request so it can be used from multiple threads.
+    """
+
+    def __init__(self, host: str, port: int, maxsize: int = 1, timeout: float = None):
+        self._host = host
+        self._port = port
+        self._http = urllib3.HTTPConnectionPool(host=self._host, port=self._port, maxsize=maxsize,
+            block=True, retries=False, timeout=timeout)
+
+    def __del__(self):
+        self._http.close()
+
+    @staticmethod
+    def bucket_path(bucket: str, bucket_type: str = None):
+        path = f"/buckets/{quote(bucket, safe='')}"
+        if bucket_type is not None:
+            path = f"/types/{quote(bucket_type, safe='')}" + path
+        return path
+
+    def object_path(self, bucket: str, key: str, bucket_type: str = None):
+        return f"{self.bucket_path(bucket, bucket_type)}/keys/{quote(key, safe='')}"
+
+    def stream_keys(self, bucket: str, bucket_type: str = None):
+        """Yield every key in a bucket using Riak's streaming key listing."""
+        r = self._http.request("GET", f"{self.bucket_path(bucket, bucket_type)}/keys?keys=stream",
+            preload_content=False)
+        try:
+            if r.status != 200:
+                raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
+            decoder = json.JSONDecoder()
+            buffer = ""
+            for chunk in r.stream(65536, decode_content=True):
+                buffer += chunk.decode('utf-8')
+                while buffer:
+                    buffer = buffer.lstrip()
+                    try:
+                        doc, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[end:]
+                    if 'error' in doc:
+                        raise urllib3.exceptions.HTTPError(f"key listing failed {doc['error']}")
+                    yield from doc.get('keys', [])
+            if buffer.strip():
+                raise ValueError("truncated key listing")
+        finally:
+            r.release_conn()
+
+    def head_vector_clocks(self, bucket: str, key: str, bucket_type: str = None):
+        """Return the vector clocks for a key, or None if it does not exist."""
+        r = self._http.request("HEAD", self.object_path(bucket, key, bucket_type))
+        if r.status == 404:
+            return None
+        if r.status not in (200, 300):
+            raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
+        return decode_http_vector_clocks(r.headers['X-Riak-Vclock'])
+
+    def get_object(self, bucket: str, key: str, bucket_type: str = None):
+        """Fetch an object, returning None if it does not exist.
+
+        Returns a dict with the value, vector_clocks, content_type and
+        last_modified (in the same string format as ReplRecord).
+        """
+        r = self._http.request("GET", self.object_path(bucket, key, bucket_type))
+        if r.status == 404:
+            return None
+        if r.status == 300:
+            raise urllib3.exceptions.HTTPError(f"key={key} has siblings")
+        if r.status != 200:
+            raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
+        last_modified = parsedate_to_datetime(r.headers['Last-Modified'])
+        return {
+            'value': r.data,
+            'vector_clocks': decode_http_vector_clocks(r.headers['X-Riak-Vclock']),
+            'content_type': r.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip().encode('utf-8'),
+            'last_modified': f"{int(last_modified.timestamp())}.0",
+        }
@@ -1,22 +1,41 @@
+import json
 import urllib3
 from record import ReplRecord
+from profiling import stage
 
 class ReplSink:
 
-    def __init__(self, host: str, port: int, queue: str, vc_format: str = "base64"):
+    def __init__(self, host: str, port: int, queue: str, vc_format: str = "base64", maxsize: int = 1):
         self._host = host
         self._port = port
         self._queue_name = queue
         self._vc_format = vc_format
         self._url = f"http://{self._host}:{self._port}/queuename/{self._queue_name}?object_format=internal"
-        self._http = urllib3.HTTPConnectionPool(host=self._host, port=self._port, retries=False)
+        self._ping_url = f"http://{self._host}:{self._port}/ping"
+        self._stats_url = f"http://{self._host}:{self._port}/stats"
+        self._http = urllib3.HTTPConnectionPool(host=self._host, port=self._port, retries=False, maxsize=maxsize)
     
     def __del__(self):
         self._http.close()
 
-    def fetch(self):
-        r = self._http.request("GET", self._url)
+    def ping(self):
+        r = self._http.request("GET", self._ping_url)
         if r.status != 200:
             raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
 
-        return ReplRecord(r.data, vc_format=self._vc_format)
+    def stats(self):
+        r = self._http.request("GET", self._stats_url)
+        if r.status != 200:
+            raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
+        return json.loads(r.data)
+
+    def fetch(self, trace=None):
+        with stage(trace, 'fetch'):
+            r = self._http.request("GET", self._url)
+        if r.status != 200:
+            raise urllib3.exceptions.HTTPError(f"invalid http response code {r.status}")
+
+        with stage(trace, 'decode'):
+            rec = ReplRecord(r.data, vc_format=self._vc_format)
+        rec.trace = trace
+        return rec
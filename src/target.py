@@ -0,0 +1,319 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from record import VectorClock
+from ratelimit import is_throttle_error
+from profiling import stage
+
+APPLIED = "applied"
+STALE = "stale"
+FAILED = "failed"
+# results of App.process_records for records which are not passed to the target
+SKIPPED = "skipped"
+HELD = "held"
+
+def vector_clocks_condition(vector_clocks: dict):
+    conditions = []
+    expression_attr_names = {'#vclocks':'_riak_vclocks'}
+    expression_attr_values = {}
+    i = 0
+    for k, v in vector_clocks.items():
+        conditions.append("attribute_not_exists(#vclocks.#a" + str(i) + ")")
+        conditions.append("#vclocks.#a" + str(i) + " < :v" + str(i))
+        expression_attr_names['#a' + str(i)] = k
+        expression_attr_values[':v' + str(i)] = v
+        i += 1
+    condition = " OR ".join(conditions)
+    return condition, expression_attr_names, expression_attr_values
+
+def clocks_newer(vector_clocks: dict, existing: dict):
+    """Return True if vector_clocks would pass the condition built by vector_clocks_condition.
+
+    That is, if any actor is missing from the existing clocks or has a greater counter.
+    """
+    if existing is None:
+        return True
+    return not VectorClock(existing).descends(vector_clocks)
+
+def tombstone_clocks(rec):
+    """Return the clocks of a delete, merging in the decoded tomb_clock if the record has one."""
+    vector_clocks = VectorClock(rec.vector_clocks or {})
+    if rec.tomb_clock:
+        vector_clocks = vector_clocks.merge(VectorClock.decode(base64.b64decode(rec.tomb_clock)))
+    return vector_clocks
+
+def record_document(rec, projection=None):
+    """Parse the JSON value of a record and apply projection if given, return None for deletes."""
+    if rec.is_delete:
+        return None
+    data = json.loads(rec.value)
+    return data if projection is None else projection(data)
+
+class ReplTarget:
+    """Destination for replicated records.
+
+    Subclasses implement apply, which writes a batch of records and returns
+    one of APPLIED, STALE or FAILED for each record in the same order.
+    """
+
+    name = None
+
+    def apply(self, records: list):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class DynamoDBTarget(ReplTarget):
+    """Writes records to the App's DynamoDB table with conditional puts and deletes.
+
+    Conditional writes cannot be made with BatchWriteItem, so each record is
+    written with its own request, paced by the App's rate limiter. Requests go
+    through the table's low level client, which unlike the Table resource is
+    thread safe, so the target can be shared by the writer pool.
+    """
+
+    name = "dynamodb"
+
+    def __init__(self, app, tombstones: bool = False, tombstone_ttl: int = 604800,
+            tombstone_ttl_attribute: str = '_riak_ttl', projection=None):
+        self.app = app
+        self.tombstones = tombstones
+        self.tombstone_ttl = tombstone_ttl
+        self.tombstone_ttl_attribute = tombstone_ttl_attribute
+        self.projection = projection
+
+    def write(self, action: str, key: str, request, tokens: int = 1, **kwargs):
+        """Make a DynamoDB write request paced by the rate limiter.
+
+        Throttled requests cut the write rate and are retried, holding the record
+        until there is capacity for it or the app is shutting down. Requests
+        writing several items take tokens for each of them.
+        """
+        limiter = self.app.limiter
+        while True:
+            limiter.acquire(tokens)
+            try:
+                response = request(**kwargs)
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                limiter.on_throttle()
+                if self.app.shutdown:
+                    self.app.logger.error(f"{action} for key={key} throttled during shutdown, dropping")
+                    raise
+                self.app.logger.warning(f"{action} for key={key} throttled, write rate now {limiter.rate:.1f}/s")
+            else:
+                limiter.on_success(tokens)
+                return response
+
+    def put_item(self, **kwargs):
+        table = self.app.table
+        return table.meta.client.put_item(TableName=table.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        table = self.app.table
+        return table.meta.client.delete_item(TableName=table.name, **kwargs)
+
+    def build_item(self, key: str, rec):
+        data = record_document(rec, self.projection)
+        data['pkey'] = key
+        data['_riak_lm'] = Decimal(rec.last_modified)
+        data['_riak_vclocks'] = dict(rec.vector_clocks)
+        return data
+
+    def make_tombstone(self, key: str, vector_clocks: dict, last_modified: str):
+        return {
+            'pkey': key,
+            '_riak_deleted': True,
+            '_riak_lm': Decimal(last_modified),
+            '_riak_vclocks': dict(vector_clocks),
+            self.tombstone_ttl_attribute: int(time.time()) + self.tombstone_ttl,
+        }
+
+    def build_tombstone(self, key: str, rec):
+        return self.make_tombstone(key, tombstone_clocks(rec), rec.last_modified)
+
+    def put_record(self, key: str, rec):
+        try:
+            with stage(rec.trace, 'json'):
+                data = self.build_item(key, rec)
+            with stage(rec.trace, 'condition'):
+                condition, attr_names, attr_values = vector_clocks_condition(rec.vector_clocks)
+            self.app.logger.info(f"Putting item key={key}")
+
+            with stage(rec.trace, 'dynamodb'):
+                self.write("Put", key, self.put_item,
+                    Item=data,
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames=attr_names,
+                    ExpressionAttributeValues=attr_values)
+        except self.app.table.meta.client.exceptions.ConditionalCheckFailedException:
+            self.app.logger.warning(f"Put for key={key} failed due to vector clock mis-match")
+            return STALE
+        except Exception as e:
+            self.app.logger.error(e)
+            return FAILED
+        return APPLIED
+
+    def delete_record(self, key: str, rec):
+        if self.tombstones:
+            return self.tombstone_record(key, rec)
+        try:
+            self.app.logger.info(f"Deleting item key={key}")
+            with stage(rec.trace, 'condition'):
+                condition, attr_names, attr_values = vector_clocks_condition(rec.vector_clocks)
+            with stage(rec.trace, 'dynamodb'):
+                self.write("Delete", key, self.delete_item,
+                    Key={'pkey':key},
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames=attr_names,
+                    ExpressionAttributeValues=attr_values)
+        except self.app.table.meta.client.exceptions.ConditionalCheckFailedException:
+            self.app.logger.warning(f"Delete for key={key} failed due to vector clock mis-match")
+            return STALE
+        except Exception as e:
+            self.app.logger.error(e)
+            return FAILED
+        return APPLIED
+
+    def tombstone_record(self, key: str, rec):
+        """Replace the item with a tombstone keeping its vector clocks, so older puts are still rejected.
+
+        The tombstone expires through DynamoDB TTL after tombstone_ttl seconds.
+        """
+        try:
+            self.app.logger.info(f"Tombstoning item key={key}")
+            with stage(rec.trace, 'condition'):
+                item = self.build_tombstone(key, rec)
+                condition, attr_names, attr_values = vector_clocks_condition(item['_riak_vclocks'])
+            with stage(rec.trace, 'dynamodb'):
+                self.write("Tombstone", key, self.put_item,
+                    Item=item,
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames=attr_names,
+                    ExpressionAttributeValues=attr_values)
+        except self.app.table.meta.client.exceptions.ConditionalCheckFailedException:
+            self.app.logger.warning(f"Delete for key={key} failed due to vector clock mis-match")
+            return STALE
+        except Exception as e:
+            self.app.logger.error(e)
+            return FAILED
+        return APPLIED
+
+    def apply(self, records: list):
+        results = []
+        for rec in records:
+            key = rec.key.decode('utf-8')
+            if rec.is_delete:
+                results.append(self.delete_record(key, rec))
+            else:
+                results.append(self.put_record(key, rec))
+        return results
+
+class SQLiteTarget(ReplTarget):
+    """Writes records to a local SQLite database, one transaction per batch.
+
+    Applies the same vector clock rule as the DynamoDB condition so stale
+    records are rejected. With tombstones, deletes keep the row with its
+    clocks and NULL data, like DELETE_MODE=tombstone for DynamoDB, so older
+    puts applied out of order are still rejected. Tombstone rows do not expire.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, logger, tombstones: bool = False, projection=None):
+        self.logger = logger
+        self.tombstones = tombstones
+        self.projection = projection
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS items (
+            pkey TEXT PRIMARY KEY,
+            vclocks TEXT NOT NULL,
+            last_modified TEXT,
+            data TEXT)""")
+        self._conn.commit()
+
+    def _apply_record(self, rec):
+        key = rec.key.decode('utf-8')
+        tombstone = rec.is_delete and self.tombstones
+        vector_clocks = dict(tombstone_clocks(rec) if tombstone else rec.vector_clocks)
+        row = self._conn.execute("SELECT vclocks FROM items WHERE pkey = ?", (key,)).fetchone()
+        if not clocks_newer(vector_clocks, json.loads(row[0]) if row else None):
+            self.logger.warning(f"Write for key={key} failed due to vector clock mis-match")
+            return STALE
+        if tombstone:
+            self._conn.execute("INSERT OR REPLACE INTO items (pkey, vclocks, last_modified, data) VALUES (?, ?, ?, NULL)",
+                (key, json.dumps(vector_clocks), rec.last_modified))
+        elif rec.is_delete:
+            self._conn.execute("DELETE FROM items WHERE pkey = ?", (key,))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO items (pkey, vclocks, last_modified, data) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(vector_clocks), rec.last_modified, json.dumps(record_document(rec, self.projection))))
+        return APPLIED
+
+    def apply(self, records: list):
+        results = []
+        with self._lock, self._conn:
+            for rec in records:
+                try:
+                    results.append(self._apply_record(rec))
+                except Exception as e:
+                    self.logger.error(e)
+                    results.append(FAILED)
+        return results
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT vclocks, last_modified, data FROM items WHERE pkey = ?", (key,)).fetchone()
+        if row is None or row[2] is None:
+            return None
+        return {'pkey': key, '_riak_vclocks': json.loads(row[0]), '_riak_lm': row[1], 'data': json.loads(row[2])}
+
+    def close(self):
+        self._conn.close()
+
+class NDJSONTarget(ReplTarget):
+    """Appends every record as a line of JSON, one write per batch.
+
+    No vector clock checks are made, consumers of the file are expected to
+    resolve versions themselves.
+    """
+
+    name = "ndjson"
+
+    def __init__(self, path: str, logger, projection=None):
+        self.logger = logger
+        self.projection = projection
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def apply(self, records: list):
+        lines = []
+        results = []
+        for rec in records:
+            try:
+                lines.append(json.dumps({
+                    'pkey': rec.key.decode('utf-8'),
+                    'op': 'delete' if rec.is_delete else 'put',
+                    '_riak_lm': rec.last_modified,
+                    '_riak_vclocks': dict(rec.vector_clocks) if rec.vector_clocks else None,
+                    'data': record_document(rec, self.projection),
+                }, separators=(',', ':')))
+                results.append(APPLIED)
+            except Exception as e:
+                self.logger.error(e)
+                results.append(FAILED)
+        with self._lock:
+            self._file.write("\n".join(lines) + "\n" if lines else "")
+            self._file.flush()
+        return results
+
+    def close(self):
+        self._file.close()
@@ -1,13 +1,18 @@
 import unittest
 from app import App
 from sink import ReplSink
-from record import ReplRecord
+from record import ReplRecord, VectorClock
+from tests.records import load_record, make_record
+from memtable import MemoryTable
+from hotkeys import HotKeyTracker, Debouncer
+from target import APPLIED, STALE
 import time
 import os
 import boto3
 from decimal import Decimal
 from unittest.mock import Mock
 from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
 import urllib3
 
 class TestApp(unittest.TestCase):
@@ -236,5 +241,190 @@ class TestApp(unittest.TestCase):
         self.assertEqual(item['Item']['pkey'], 'testkey')
         self.assertEqual(item['Item']['test'], 'data')
 
+class TestAppCoalesce(unittest.TestCase):
+
+    def test_coalesce(self):
+        app = App()
+        app.logger = Mock()
+        old = make_record(b'a', {'x': 1})
+        new = make_record(b'a', {'x': 2})
+        duplicate = make_record(b'a', {'x': 2})
+        sibling = make_record(b'a', {'y': 1})
+        other = make_record(b'b', {'x': 1})
+
+        self.assertEqual(app.coalesce([old, other, new, duplicate, sibling]), [other, new, sibling])
+        app.logger.info.assert_called_with("Coalesced 2 superseded records")
+
+class TestAppConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+
+    def tearDown(self):
+        for executor in (self.app.fetch_executor, self.app.write_executor):
+            if executor is not None:
+                executor.shutdown()
+
+    def test_apply_records_by_key(self):
+        self.app.writers.value = 3
+        self.app.write_executor = ThreadPoolExecutor(max_workers=3)
+        applied = []
+        def apply(records):
+            applied.append([rec.key for rec in records])
+            return [rec.key.decode('utf-8') for rec in records]
+        self.app.target = Mock()
+        self.app.target.apply.side_effect = apply
+        records = [make_record(key) for key in [b'a', b'b', b'c', b'a', b'd', b'b']]
+
+        self.assertEqual(self.app.apply_records(records), ['a', 'b', 'c', 'a', 'd', 'b'])
+        self.assertGreater(len(applied), 1)
+        for part in applied:
+            for key in set(part):
+                self.assertTrue(all(key not in other for other in applied if other is not part))
+
+    def test_fetch_records_keeps_records_on_error(self):
+        self.app.fetchers.value = 3
+        self.app.fetch_executor = ThreadPoolExecutor(max_workers=3)
+        self.app.sink = Mock()
+        rec = make_record(b'a')
+        self.app.sink.fetch.side_effect = [rec, urllib3.exceptions.HTTPError('down'), rec]
+
+        records, error = self.app.fetch_records()
+
+        self.assertEqual(records, [rec, rec])
+        self.assertIsInstance(error, urllib3.exceptions.HTTPError)
+
+    def test_autoscale(self):
+        self.app.fetchers.maximum = 4
+        self.app.writers.maximum = 2
+        monitor = Mock(length=5000, eta=float('inf'))
+
+        self.app.autoscale(monitor)
+
+        self.assertEqual((self.app.fetchers.value, self.app.writers.value), (2, 2))
+        self.assertEqual(self.app.collect_metrics()['riak_repl_fetchers'], 2)
+
+class TestAppHotKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.bucket_filter = 'test'
+        self.app.hot_keys = HotKeyTracker(k=2, min_count=3)
+        self.app.debouncer = Debouncer(60)
+        self.app.target = Mock()
+        self.app.target.apply.side_effect = lambda records: [APPLIED] * len(records)
+
+    def written(self):
+        return [(rec.key, rec.vector_clocks['a']) for call in self.app.target.apply.call_args_list for rec in call.args[0]]
+
+    def test_debounce_hot_key(self):
+        for i in range(1, 6):
+            self.app.process_records([make_record(b'hot', {'a': i}, b'{}'), make_record(b'cold%d' % i, {'a': 1}, b'{}')])
+
+        self.assertEqual(self.written(), [(b'hot', 1), (b'cold1', 1), (b'hot', 2), (b'cold2', 1), (b'cold3', 1),
+            (b'cold4', 1), (b'cold5', 1)])
+        self.assertEqual(len(self.app.debouncer), 1)
+        self.assertEqual(self.app.hot_keys.top(1), [('test/hot', 5)])
+
+        self.app.shutdown = True
+        self.app.flush_debounced()
+
+        self.assertEqual(self.written()[-1], (b'hot', 5))
+        self.assertEqual(self.app.collect_metrics()['riak_repl_hot_key_count{key="test/hot"}'], 5)
+
+    def test_without_debounce(self):
+        self.app.debouncer = None
+        for i in range(1, 6):
+            self.app.process_record(make_record(b'hot', {'a': i}, b'{}'))
+
+        self.assertEqual(len(self.written()), 5)
+        self.assertEqual(self.app.flush_debounced(), [])
+
+class TestAppTombstone(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['DELETE_MODE'] = 'tombstone'
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.table = MemoryTable()
+
+    def tearDown(self):
+        del os.environ['DELETE_MODE']
+
+    def test_tombstone_rejects_older_put(self):
+        self.assertEqual(self.app.update_item('testkey', make_record(b'testkey', {'a': 1}, b'{"test":"data"}')), APPLIED)
+        self.assertEqual(self.app.delete_item('testkey', make_record(b'testkey', {'a': 2}, is_delete=True)), APPLIED)
+
+        item = self.app.table.get_item(Key={'pkey': 'testkey'})['Item']
+        self.assertTrue(item['_riak_deleted'])
+        self.assertEqual(item['_riak_vclocks'], {'a': 2})
+        self.assertAlmostEqual(item['_riak_ttl'], time.time() + 604800, delta=5)
+        self.assertNotIn('test', item)
+
+        self.assertEqual(self.app.update_item('testkey', make_record(b'testkey', {'a': 1}, b'{"test":"old"}')), STALE)
+        self.assertEqual(self.app.update_item('testkey', make_record(b'testkey', {'a': 3}, b'{"test":"new"}')), APPLIED)
+
+        item = self.app.table.get_item(Key={'pkey': 'testkey'})['Item']
+        self.assertEqual(item['test'], 'new')
+        self.assertNotIn('_riak_deleted', item)
+
+    def test_tombstone_before_put(self):
+        self.assertEqual(self.app.delete_item('testkey', make_record(b'testkey', {'a': 2}, is_delete=True)), APPLIED)
+        self.assertEqual(self.app.update_item('testkey', make_record(b'testkey', {'a': 1}, b'{"test":"old"}')), STALE)
+        self.assertEqual(self.app.delete_item('testkey', make_record(b'testkey', {'a': 2}, is_delete=True)), STALE)
+
+    def test_tomb_clock(self):
+        rec = load_record("test3", vc_format='vclock')
+        rec.vector_clocks = VectorClock({'other': 1})
+
+        item = self.app.target.build_tombstone('test', rec)
+
+        self.assertEqual(item['_riak_vclocks'], {'other': 1,
+            '1090001219101612390251762380001': 3, '1090008191016123902515938': 2})
+
+    def test_invalid_delete_mode(self):
+        os.environ['DELETE_MODE'] = 'soft'
+        with self.assertRaisesRegex(ValueError, 'Invalid delete mode soft'):
+            App()
+
+class TestAppStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+        os.environ['STARTUP_BACKOFF_MIN'] = '0.01'
+        os.environ['STARTUP_TIMEOUT'] = '0.2'
+
+    def tearDown(self):
+        del os.environ['STARTUP_BACKOFF_MIN']
+        del os.environ['STARTUP_TIMEOUT']
+
+    def test_wait_until_ready_retries(self):
+        setup = Mock(side_effect=[ConnectionError('refused'), ConnectionError('refused'), 'ready'])
+
+        self.assertEqual(self.app.wait_until_ready("Test", setup), 'ready')
+        self.assertEqual(setup.call_count, 3)
+        self.app.logger.warning.assert_called_with("Test not ready (refused), retrying in 0.0 seconds")
+
+    def test_wait_until_ready_timeout(self):
+        setup = Mock(side_effect=ConnectionError('refused'))
+
+        with self.assertRaises(ConnectionError):
+            self.app.wait_until_ready("Test", setup)
+        self.app.logger.error.assert_called_with("Test not ready after 0.2 seconds")
+
+    def test_setup_concurrent(self):
+        sink = Mock()
+        self.app.setup_riak = Mock(return_value=sink)
+        self.app.setup_dynamodb_table = Mock(side_effect=[ConnectionError('refused'), 'table'])
+        self.app.start_time = time.monotonic()
+
+        self.app.setup()
+
+        self.assertIs(self.app.sink, sink)
+        self.assertEqual(self.app.table, 'table')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
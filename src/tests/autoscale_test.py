@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import Mock
+from autoscale import queue_length, QueueMonitor, ConcurrencyScaler
+
+class TestQueueLength(unittest.TestCase):
+
+    def test_queue_length(self):
+        self.assertEqual(queue_length({'len': 12}, 'len', 'q1'), 12)
+        self.assertEqual(queue_length({'len': {'q1': 5, 'q2': 7}}, 'len', 'q1'), 5)
+        self.assertEqual(queue_length({'len': {'q1': [1, 2, 3]}}, 'len', 'q1'), 6)
+        self.assertEqual(queue_length({'len': {'q1': {'p1': 1, 'p2': 4}}}, 'len', 'q1'), 5)
+
+    def test_missing(self):
+        with self.assertRaisesRegex(ValueError, 'No length for queue q3 in stat len'):
+            queue_length({'len': {'q1': 5}}, 'len', 'q3')
+        with self.assertRaisesRegex(ValueError, 'No length for queue q1 in stat len'):
+            queue_length({}, 'len', 'q1')
+
+class TestQueueMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = Mock()
+        self.monitor = QueueMonitor(Mock(), 'q1', self.logger, 'len', window=60)
+
+    def test_unknown(self):
+        self.assertEqual(self.monitor.stats(), {'length': None, 'drain_rate': None, 'eta': None})
+
+    def test_draining(self):
+        self.monitor.add_sample(1000, now=0)
+        self.monitor.add_sample(800, now=10)
+
+        self.assertEqual(self.monitor.length, 800)
+        self.assertEqual(self.monitor.drain_rate, 20)
+        self.assertEqual(self.monitor.eta, 40)
+
+    def test_growing(self):
+        self.monitor.add_sample(100, now=0)
+        self.monitor.add_sample(200, now=10)
+
+        self.assertEqual(self.monitor.drain_rate, -10)
+        self.assertEqual(self.monitor.eta, float('inf'))
+
+    def test_empty(self):
+        self.monitor.add_sample(0, now=0)
+
+        self.assertEqual(self.monitor.eta, 0)
+
+    def test_window(self):
+        for t in range(0, 200, 10):
+            self.monitor.add_sample(1000 - t, now=t)
+
+        self.assertEqual(len(self.monitor._samples), 7)
+        self.assertEqual(self.monitor.drain_rate, 1)
+
+    def test_poll(self):
+        on_sample = Mock()
+        self.monitor.fetch_stats = Mock(side_effect=[{'len': {'q1': 10}}, ConnectionError('refused')])
+        self.monitor.on_sample = on_sample
+
+        self.assertEqual(self.monitor.poll(), 10)
+        on_sample.assert_called_once_with(self.monitor)
+        self.assertIsNone(self.monitor.poll())
+        self.assertEqual(self.monitor.error_count, 1)
+        self.logger.warning.assert_called_with("Polling queue length failed: refused")
+        self.assertEqual(self.monitor.length, 10)
+
+class TestConcurrencyScaler(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = Mock()
+        self.scaler = ConcurrencyScaler('fetchers', 1, 6, self.logger, catch_up=60, low_water=100)
+
+    def test_scale_up_when_behind(self):
+        self.assertEqual(self.scaler.update(5000, None), 2)
+        self.assertEqual(self.scaler.update(5000, float('inf')), 4)
+        self.assertEqual(self.scaler.update(5000, 120), 6)
+        self.assertEqual(self.scaler.update(5000, 120), 6)
+        self.logger.info.assert_called_with("Scaling fetchers from 4 to 6, queue length=5000 eta=120s")
+
+    def test_hold_when_catching_up(self):
+        self.scaler.value = 4
+
+        self.assertEqual(self.scaler.update(5000, 30), 4)
+
+    def test_scale_down_when_idle(self):
+        self.scaler.value = 3
+
+        self.assertEqual(self.scaler.update(50, 1), 2)
+        self.assertEqual(self.scaler.update(0, 0), 1)
+        self.assertEqual(self.scaler.update(0, 0), 1)
+        self.assertEqual(self.scaler.update(None, None), 1)
+
+    def test_invalid_limits(self):
+        with self.assertRaisesRegex(ValueError, 'Invalid writers concurrency limits min=4 max=2'):
+            ConcurrencyScaler('writers', 4, 2, self.logger)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import os
+import json
+import tempfile
+from unittest.mock import Mock
+from app import App
+from memtable import MemoryTable, ProvisionedThroughputExceededException
+from ratelimit import AdaptiveRateLimiter
+from bulkload import BulkLoader
+
+class TestBulkLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.table = MemoryTable()
+        self.app.limiter = AdaptiveRateLimiter(rate=1000, max_rate=1000)
+        self.objects = {f'key{i}': {
+            'value': json.dumps({'n': i}).encode('utf-8'),
+            'vector_clocks': {'a': i + 1},
+            'content_type': b'application/json',
+            'last_modified': '1618846125.0'} for i in range(60)}
+        self.objects['binary'] = dict(self.objects['key0'], content_type=b'application/octet-stream')
+        self.riak = Mock()
+        self.riak.stream_keys.side_effect = lambda bucket, bucket_type: iter(list(self.objects) + ['gone'])
+        self.riak.get_object.side_effect = lambda bucket, key, bucket_type: self.objects.get(key)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.loader = BulkLoader(self.app, self.riak, 'test', workers=4, max_pending=8,
+            marker_path=os.path.join(self.tmpdir.name, 'marker.json'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load(self):
+        started_at = self.loader.load()
+
+        self.assertEqual(len(self.app.table), 60)
+        self.assertEqual(self.app.table.get_item(Key={'pkey': 'key7'})['Item']['n'], 7)
+        self.assertEqual(self.app.table.get_item(Key={'pkey': 'key7'})['Item']['_riak_vclocks'], {'a': 8})
+        self.assertEqual(self.loader.key_count, 62)
+        self.assertEqual(self.loader.skipped_count, 2)
+        with open(self.loader.marker_path) as f:
+            marker = json.load(f)
+        self.assertTrue(marker['finished'])
+        self.assertEqual(marker['started_at'], started_at)
+        self.assertEqual(marker['loaded'], 60)
+
+    def test_load_uses_batches(self):
+        self.loader.load()
+
+        self.assertEqual(self.app.limiter.success_count, 3)
+
+    def test_skips_non_empty_table(self):
+        self.app.table.put_item(Item={'pkey': 'existing'})
+
+        self.assertIsNone(self.loader.load())
+        self.assertEqual(len(self.app.table), 1)
+        self.app.logger.warning.assert_called_with("Table test is not empty, skipping bulk load")
+
+        self.loader.load(force=True)
+        self.assertEqual(len(self.app.table), 61)
+
+    def test_skips_finished_load(self):
+        started_at = self.loader.load()
+        self.app.table = MemoryTable()
+
+        self.assertIsNone(self.loader.load())
+        self.assertEqual(len(self.app.table), 0)
+        self.app.logger.info.assert_called_with(f"Bulk load of bucket=test already finished, started at {started_at}, skipping")
+
+    def test_refuses_unfinished_load(self):
+        def get_object(bucket, key, bucket_type):
+            if key == 'key30':
+                self.app.shutdown = True
+            return self.objects.get(key)
+        self.riak.get_object.side_effect = get_object
+
+        self.assertIsNone(self.loader.load())
+        self.assertLess(len(self.app.table), 60)
+        with open(self.loader.marker_path) as f:
+            self.assertFalse(json.load(f)['finished'])
+
+        self.app.shutdown = False
+        with self.assertRaisesRegex(RuntimeError, r'Bulk load of bucket=test started at [\d.]+ did not finish'):
+            self.loader.load()
+
+        self.riak.get_object.side_effect = lambda bucket, key, bucket_type: self.objects.get(key)
+        self.loader.load(force=True)
+        self.assertEqual(len(self.app.table), 60)
+
+    def test_failed_batch_is_skipped(self):
+        batch_write_item = self.app.table.meta.client.batch_write_item
+        calls = []
+        def failing(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise ValueError("Item size has exceeded the maximum allowed size")
+            return batch_write_item(**kwargs)
+        self.app.table.meta.client.batch_write_item = failing
+
+        self.assertIsNotNone(self.loader.load())
+
+        self.assertEqual(len(self.app.table), 35)
+        self.assertEqual((self.loader.loaded_count, self.loader.skipped_count), (35, 27))
+        self.app.logger.error.assert_called_with("BatchWrite for key=key25 failed, skipping 25 items: "
+            "Item size has exceeded the maximum allowed size")
+
+    def throttle(self, calls: set):
+        put_item = self.app.table.put_item
+        count = []
+        def throttled(**kwargs):
+            count.append(kwargs)
+            if len(count) in calls:
+                raise ProvisionedThroughputExceededException("throttled", "PutItem")
+            return put_item(**kwargs)
+        self.app.table.put_item = throttled
+
+    def test_unprocessed_items_are_retried(self):
+        self.throttle({2, 3})
+
+        self.loader.load()
+
+        self.assertEqual(self.app.limiter.throttle_count, 1)
+        self.assertEqual(len(self.app.table), 60)
+        self.assertRegex(self.app.logger.warning.call_args_list[0].args[0],
+            r"BatchWrite for key=key0 left 2 items unprocessed, write rate now [\d.]+/s")
+
+    def test_throttled_batch_is_retried(self):
+        self.throttle(set(range(1, 26)))
+
+        self.loader.load()
+
+        self.assertEqual(self.app.limiter.throttle_count, 1)
+        self.assertEqual(len(self.app.table), 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import random
+import threading
+from tests.records import make_record
+from hotkeys import CountMinSketch, HotKeyTracker, Debouncer, hot_key_id
+
+class TestCountMinSketch(unittest.TestCase):
+
+    def test_never_underestimates(self):
+        sketch = CountMinSketch(width=64, depth=4)
+        counts = {}
+        rng = random.Random(1)
+        for _ in range(5000):
+            key = f"key{rng.randrange(500)}"
+            counts[key] = counts.get(key, 0) + 1
+            sketch.add(key)
+
+        for key, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(key), count)
+
+    def test_exact_when_sparse(self):
+        sketch = CountMinSketch()
+        self.assertEqual(sketch.add('a'), 1)
+        self.assertEqual(sketch.add('a', 4), 5)
+        self.assertEqual(sketch.estimate('a'), 5)
+        self.assertEqual(sketch.estimate('b'), 0)
+
+    def test_decay(self):
+        sketch = CountMinSketch()
+        sketch.add('a', 9)
+        sketch.decay()
+
+        self.assertEqual(sketch.estimate('a'), 4)
+
+    def test_invalid_dimensions(self):
+        with self.assertRaisesRegex(ValueError, 'Invalid sketch dimensions width=0 depth=4'):
+            CountMinSketch(width=0)
+
+class TestHotKeyTracker(unittest.TestCase):
+
+    def test_top_k(self):
+        tracker = HotKeyTracker(k=3, min_count=50)
+        rng = random.Random(2)
+        for _ in range(10000):
+            if rng.random() < 0.3:
+                tracker.add(rng.choice(['hot1', 'hot2', 'hot3']))
+            else:
+                tracker.add(f"cold{rng.randrange(5000)}")
+
+        self.assertEqual({key for key, _ in tracker.top()}, {'hot1', 'hot2', 'hot3'})
+        self.assertLessEqual(len(tracker._heap), 4 * tracker.k)
+        self.assertTrue(tracker.is_hot('hot1'))
+        self.assertFalse(tracker.is_hot('cold1'))
+
+    def test_min_count(self):
+        tracker = HotKeyTracker(k=3, min_count=3)
+        tracker.add('a')
+        tracker.add('a')
+        self.assertFalse(tracker.is_hot('a'))
+        tracker.add('a')
+        self.assertTrue(tracker.is_hot('a'))
+
+    def test_tick(self):
+        tracker = HotKeyTracker(k=3, decay_interval=60)
+        for _ in range(4):
+            tracker.add('a')
+        tracker.add('b')
+
+        self.assertFalse(tracker.tick(now=0))
+        self.assertTrue(tracker.tick(now=tracker._decay_at))
+        self.assertEqual(tracker.top(), [('a', 2)])
+
+    def test_concurrent_add(self):
+        tracker = HotKeyTracker(k=5)
+        def add(seed):
+            rng = random.Random(seed)
+            for _ in range(5000):
+                tracker.add(f"key{rng.randrange(50)}")
+        threads = [threading.Thread(target=add, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(tracker.count, 40000)
+        self.assertEqual(len(tracker.top()), 5)
+        self.assertTrue(all(tracker._top.get(key, 0) >= count for count, key in tracker._heap))
+
+    def test_hot_key_id(self):
+        self.assertEqual(hot_key_id(make_record(b'k')), 'test/k')
+        self.assertEqual(hot_key_id(make_record(b'k', bucket_type=b'type')), 'type/test/k')
+
+class TestDebouncer(unittest.TestCase):
+
+    def test_keeps_latest_version(self):
+        debouncer = Debouncer(1)
+        old = make_record(b'a', {'x': 1})
+        new = make_record(b'a', {'x': 2})
+        sibling = make_record(b'a', {'y': 1})
+        stale = make_record(b'a', {'x': 1})
+
+        for rec in (old, new, sibling, stale):
+            debouncer.hold('test/a', rec)
+
+        self.assertIn('test/a', debouncer)
+        self.assertEqual(len(debouncer), 2)
+        self.assertEqual(debouncer.superseded_count, 2)
+        self.assertEqual(debouncer.release(), [new, sibling])
+        self.assertEqual(len(debouncer), 0)
+
+    def test_without_vector_clocks(self):
+        debouncer = Debouncer(1)
+        first = make_record(b'a')
+        second = make_record(b'a')
+        debouncer.hold('test/a', first)
+        debouncer.hold('test/a', second)
+
+        self.assertEqual(debouncer.release(), [second])
+
+    def test_due(self):
+        debouncer = Debouncer(10)
+        self.assertFalse(debouncer.due(now=debouncer._release_at + 1))
+        debouncer.hold('test/a', make_record(b'a'))
+
+        self.assertFalse(debouncer.due(now=debouncer._release_at - 1))
+        self.assertTrue(debouncer.due(now=debouncer._release_at))
+
+if __name__ == '__main__':
+    unittest.main()
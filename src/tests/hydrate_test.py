@@ -0,0 +1,120 @@
+import unittest
+import threading
+from unittest.mock import Mock
+from app import App
+from tests.records import load_record
+from memtable import MemoryTable
+from hydrate import Hydrator
+from target import APPLIED, SKIPPED
+
+def head_only_record(key: bytes = b'test'):
+    rec = load_record("test")
+    rec.key = key
+    rec.value = b''
+    rec.head_only = True
+    del rec.meta[b'content-type']
+    return rec
+
+OBJECT = {
+    'value': b'{"test":"hydrated"}',
+    'vector_clocks': {'1090001219101612390251762380001': 3},
+    'content_type': b'application/json',
+    'last_modified': '1618846200.0',
+}
+
+class TestHydrator(unittest.TestCase):
+
+    def setUp(self):
+        self.riak = Mock()
+        self.hydrator = Hydrator(self.riak, Mock(), workers=4)
+
+    def tearDown(self):
+        self.hydrator.close()
+
+    def test_hydrate(self):
+        self.riak.get_object.return_value = OBJECT
+        rec = head_only_record()
+
+        self.assertEqual(self.hydrator.hydrate([rec]), 1)
+
+        self.assertFalse(rec.head_only)
+        self.assertEqual(rec.value, OBJECT['value'])
+        self.assertEqual(rec.content_type, b'application/json')
+        self.assertEqual(rec.vector_clocks, OBJECT['vector_clocks'])
+        self.assertEqual(rec.last_modified, OBJECT['last_modified'])
+        self.riak.get_object.assert_called_once_with('test', 'test', None)
+
+    def test_skips_full_records(self):
+        rec = load_record("test")
+
+        self.assertEqual(self.hydrator.hydrate([rec]), 0)
+        self.riak.get_object.assert_not_called()
+
+    def test_deduplicates_in_flight(self):
+        release = threading.Event()
+        def get_object(bucket, key, bucket_type):
+            release.wait()
+            return OBJECT
+        self.riak.get_object.side_effect = get_object
+        records = [head_only_record(), head_only_record(), head_only_record(b'other')]
+
+        thread = threading.Thread(target=self.hydrator.hydrate, args=(records,))
+        thread.start()
+        while len(self.hydrator._inflight) < 2:
+            pass
+        release.set()
+        thread.join()
+
+        self.assertEqual(self.riak.get_object.call_count, 2)
+        self.assertTrue(all(not rec.head_only for rec in records))
+
+    def test_missing_object(self):
+        self.riak.get_object.return_value = None
+        rec = head_only_record()
+
+        self.hydrator.hydrate([rec])
+
+        self.assertTrue(rec.head_only)
+        self.assertEqual(self.hydrator.failed_count, 1)
+
+    def test_app_hydrates_batch(self):
+        self.riak.get_object.return_value = OBJECT
+        app = App()
+        app.logger = Mock()
+        app.bucket_filter = 'test'
+        app.table = MemoryTable()
+        app.hydrator = self.hydrator
+
+        app.process_records([head_only_record()])
+
+        self.assertEqual(app.table.get_item(Key={'pkey': 'test'})['Item']['test'], 'hydrated')
+
+    def test_app_hydrates_filtered_bucket_only(self):
+        self.riak.get_object.return_value = OBJECT
+        app = App()
+        app.logger = Mock()
+        app.bucket_filter = 'test'
+        app.target = Mock()
+        app.target.apply.return_value = [APPLIED]
+        app.hydrator = self.hydrator
+        other = head_only_record(b'other')
+        other.bucket = b'other'
+
+        self.assertEqual(app.process_records([head_only_record(), other]), [APPLIED, SKIPPED])
+
+        self.riak.get_object.assert_called_once_with('test', 'test', None)
+        self.assertEqual(len(app.target.apply.call_args[0][0]), 1)
+
+    def test_app_rejects_unhydrated(self):
+        app = App()
+        app.logger = Mock()
+        app.bucket_filter = 'test'
+        app.target = Mock()
+
+        app.process_records([head_only_record()])
+
+        app.target.apply.assert_not_called()
+        app.logger.warning.assert_called_with("Key not hydrated test test")
+
+if __name__ == '__main__':
+    unittest.main()
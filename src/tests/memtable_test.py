@@ -0,0 +1,204 @@
+import unittest
+import os
+import time
+from decimal import Decimal
+from unittest.mock import Mock
+from app import App
+from tests.records import load_record
+from target import vector_clocks_condition
+from memtable import MemoryTable, MemoryTableError, ConditionExpression, ProvisionedThroughputExceededException
+
+class TestConditionExpression(unittest.TestCase):
+
+    def test_vector_clocks_condition(self):
+        """
+        Test the condition built by vector_clocks_condition is evaluated
+        """
+        condition, names, values = vector_clocks_condition({'a': 2, 'b': 1})
+        expr = ConditionExpression(condition)
+
+        self.assertTrue(expr.evaluate(None, names, values))
+        self.assertTrue(expr.evaluate({'_riak_vclocks': {'a': Decimal(1), 'b': Decimal(1)}}, names, values))
+        self.assertTrue(expr.evaluate({'_riak_vclocks': {'a': Decimal(2)}}, names, values))
+        self.assertFalse(expr.evaluate({'_riak_vclocks': {'a': Decimal(2), 'b': Decimal(1)}}, names, values))
+        self.assertFalse(expr.evaluate({'_riak_vclocks': {'a': Decimal(3), 'b': Decimal(2)}}, names, values))
+
+    def test_boolean_operators(self):
+        """
+        Test AND/OR/NOT precedence and parentheses
+        """
+        values = {':x': 1, ':y': 2}
+        item = {'x': 1, 'y': 3}
+        self.assertTrue(ConditionExpression("x = :x OR y = :y AND x = :y").evaluate(item, {}, values))
+        self.assertFalse(ConditionExpression("(x = :x OR y = :y) AND x = :y").evaluate(item, {}, values))
+        self.assertTrue(ConditionExpression("NOT y = :y").evaluate(item, {}, values))
+        self.assertTrue(ConditionExpression("y BETWEEN :y AND :y OR x <> :x").evaluate({'y': 2}, {}, values))
+
+    def test_functions_and_paths(self):
+        """
+        Test attribute functions over nested paths
+        """
+        item = {'m': {'l': ['abc', 'def']}}
+        names = {'#m': 'm'}
+        self.assertTrue(ConditionExpression("attribute_exists(#m.l[1])").evaluate(item, names, {}))
+        self.assertTrue(ConditionExpression("attribute_not_exists(#m.l[2])").evaluate(item, names, {}))
+        self.assertTrue(ConditionExpression("begins_with(#m.l[0], :p)").evaluate(item, names, {':p': 'ab'}))
+
+    def test_type_mismatch(self):
+        """
+        Test comparisons between different types are false
+        """
+        self.assertFalse(ConditionExpression("x < :v").evaluate({'x': 'a'}, {}, {':v': 1}))
+        self.assertTrue(ConditionExpression("x <> :v").evaluate({'x': 'a'}, {}, {':v': 1}))
+
+    def test_invalid_expression(self):
+        with self.assertRaises(ValueError):
+            ConditionExpression("x < ")
+        with self.assertRaises(ValueError):
+            ConditionExpression("x ! :v")
+
+class TestMemoryTable(unittest.TestCase):
+
+    def test_put_get_delete(self):
+        table = MemoryTable()
+        table.put_item(Item={'pkey': 'test', 'value': 'data'})
+
+        self.assertEqual(table.get_item(Key={'pkey': 'test'})['Item']['value'], 'data')
+
+        table.delete_item(Key={'pkey': 'test'})
+
+        self.assertNotIn('Item', table.get_item(Key={'pkey': 'test'}))
+
+    def test_conditional_check_failed(self):
+        table = MemoryTable()
+        table.put_item(Item={'pkey': 'test', 'n': 2})
+
+        with self.assertRaises(table.meta.client.exceptions.ConditionalCheckFailedException) as cm:
+            table.put_item(Item={'pkey': 'test', 'n': 1}, ConditionExpression="n < :n", ExpressionAttributeValues={':n': 1})
+
+        self.assertEqual(cm.exception.response['Error']['Code'], 'ConditionalCheckFailedException')
+        self.assertEqual(table.get_item(Key={'pkey': 'test'})['Item']['n'], 2)
+
+    def test_items_are_copied(self):
+        table = MemoryTable()
+        item = {'pkey': 'test', 'm': {'a': 1}}
+        table.put_item(Item=item)
+        item['m']['a'] = 2
+
+        self.assertEqual(table.get_item(Key={'pkey': 'test'})['Item']['m']['a'], 1)
+
+    def test_throttle_rate(self):
+        table = MemoryTable(throttle_rate=1.0)
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            table.put_item(Item={'pkey': 'test'})
+
+        self.assertEqual(table.throttled_count, 1)
+        self.assertEqual(len(table), 0)
+
+    def test_write_capacity(self):
+        table = MemoryTable(write_capacity=2)
+        table.put_item(Item={'pkey': 'a'})
+        table.put_item(Item={'pkey': 'b'})
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            table.put_item(Item={'pkey': 'c'})
+
+    def test_batch_write_unprocessed(self):
+        table = MemoryTable(write_capacity=2)
+        requests = [{'PutRequest': {'Item': {'pkey': k}}} for k in 'abc'] + [{'DeleteRequest': {'Key': {'pkey': 'a'}}}]
+
+        response = table.meta.client.batch_write_item(RequestItems={'test': requests})
+
+        self.assertEqual(response['UnprocessedItems'], {'test': requests[2:]})
+        self.assertEqual(len(table), 2)
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            table.meta.client.batch_write_item(RequestItems={'test': requests[2:]})
+
+    def test_client(self):
+        table = MemoryTable()
+        client = table.meta.client
+        client.put_item(TableName='test', Item={'pkey': 'a', 'n': 1})
+
+        self.assertEqual(client.scan(TableName='test')['Items'], [{'pkey': 'a', 'n': 1}])
+        client.delete_item(TableName='test', Key={'pkey': 'a'})
+        self.assertEqual(len(table), 0)
+        with self.assertRaises(client.exceptions.ResourceNotFoundException):
+            client.put_item(TableName='other', Item={'pkey': 'a'})
+
+    def test_batch_write_too_many_items(self):
+        table = MemoryTable()
+        requests = [{'PutRequest': {'Item': {'pkey': str(i)}}} for i in range(26)]
+
+        with self.assertRaisesRegex(MemoryTableError, 'Too many items'):
+            table.meta.client.batch_write_item(RequestItems={'test': requests})
+        self.assertEqual(len(table), 0)
+
+    def test_scan(self):
+        table = MemoryTable()
+        for i in range(10):
+            table.put_item(Item={'pkey': f'key{i}', 'n': i, 'blob': 'x'})
+
+        keys = []
+        for segment in range(3):
+            kwargs = {'Segment': segment, 'TotalSegments': 3, 'Limit': 2, 'ProjectionExpression': 'pkey, #n', 'ExpressionAttributeNames': {'#n': 'n'}}
+            while True:
+                response = table.scan(**kwargs)
+                for item in response['Items']:
+                    self.assertEqual(set(item), {'pkey', 'n'})
+                    keys.append(item['pkey'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        self.assertEqual(sorted(keys), sorted(f'key{i}' for i in range(10)))
+
+    def test_latency(self):
+        table = MemoryTable(latency=0.05)
+        start = time.monotonic()
+        table.get_item(Key={'pkey': 'test'})
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+class TestAppMemoryTable(unittest.TestCase):
+
+    def setUp(self):
+        self.rec = load_record("test")
+        self.app = App()
+        self.app.logger = Mock()
+        os.environ['DYNAMODB_BACKEND'] = 'memory'
+        self.app.table = self.app.setup_dynamodb_table()
+
+    def tearDown(self):
+        del os.environ['DYNAMODB_BACKEND']
+
+    def test_setup_memory_table(self):
+        self.assertIsInstance(self.app.table, MemoryTable)
+
+    def test_update_item(self):
+        self.app.update_item('test', self.rec)
+
+        item = self.app.table.get_item(Key={'pkey':'test'})
+
+        self.assertEqual(item['Item']['_riak_lm'], Decimal('1618846125.126554'))
+        self.assertEqual(item['Item']['test'], 'data4')
+
+    def test_update_item_with_older(self):
+        self.app.table.put_item(Item={'pkey':'test', '_riak_vclocks': self.rec.vector_clocks})
+
+        self.app.update_item('test', self.rec)
+
+        self.assertNotIn('test', self.app.table.get_item(Key={'pkey':'test'})['Item'])
+        self.app.logger.warning.assert_called_with("Put for key=test failed due to vector clock mis-match")
+
+    def test_delete_item_with_older(self):
+        self.app.table.put_item(Item={'pkey':'test', '_riak_vclocks': self.rec.vector_clocks})
+
+        self.app.delete_item('test', self.rec)
+
+        self.assertIn('Item', self.app.table.get_item(Key={'pkey':'test'}))
+        self.app.logger.warning.assert_called_with("Delete for key=test failed due to vector clock mis-match")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+import urllib3
+from unittest.mock import Mock
+from metrics import metric_name, render, MetricsServer
+
+class TestMetrics(unittest.TestCase):
+
+    def test_metric_name(self):
+        self.assertEqual(metric_name('queue_length'), 'queue_length')
+        self.assertEqual(metric_name('hot_key', bucket='test', key='a"b'), 'hot_key{bucket="test",key="a\\"b"}')
+
+    def test_render(self):
+        self.assertEqual(render({'a': 1, 'b': 0.5, 'c': None, 'd': float('inf'), 'e': True}),
+            "a 1\nb 0.5\nc NaN\nd +Inf\ne 1\n")
+
+    def test_server(self):
+        server = MetricsServer(0, lambda: {'queue_length': 3}, Mock(), host='127.0.0.1').start()
+        try:
+            http = urllib3.PoolManager()
+            r = http.request('GET', f'http://127.0.0.1:{server.port}/metrics')
+            self.assertEqual(r.status, 200)
+            self.assertEqual(r.data, b'queue_length 3\n')
+            self.assertEqual(http.request('GET', f'http://127.0.0.1:{server.port}/other').status, 404)
+        finally:
+            server.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import time
+import tempfile
+import tracemalloc
+from unittest.mock import Mock
+from app import App
+from tests.records import load_record
+from memtable import MemoryTable
+from profiling import Profiler, StageTracer, Trace, stage
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.logger = Mock()
+        self.profiler = Profiler(self.logger, output_dir=self.tmpdir.name, duration=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cpu_profile(self):
+        self.profiler.start_cpu()
+        sum(range(1000))
+        self.profiler.poll()
+
+        self.assertEqual(len([f for f in os.listdir(self.tmpdir.name) if f.startswith('cpu-')]), 1)
+        self.assertIn("CPU profile written to", self.logger.info.call_args[0][0])
+
+    def test_memory_profile(self):
+        self.profiler.start_memory()
+        data = [bytes(100) for _ in range(100)]
+        self.profiler.poll()
+
+        self.assertEqual(len([f for f in os.listdir(self.tmpdir.name) if f.startswith('memory-')]), 1)
+        self.assertIn("Memory profile written to", self.logger.info.call_args[0][0])
+        del data
+
+    def test_poll_before_deadline(self):
+        self.profiler.duration = 60
+        self.profiler.start_cpu()
+        self.profiler.poll()
+        self.profiler.start_cpu()
+
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.profiler.stop_cpu()
+
+    def test_missing_output_dir(self):
+        self.profiler.output_dir = os.path.join(self.tmpdir.name, 'missing')
+        self.profiler.start_cpu()
+        self.profiler.start_memory()
+
+        self.profiler.poll()
+
+        self.assertIn("CPU profile failed", self.logger.error.call_args_list[0][0][0])
+        self.assertIn("Memory profile failed", self.logger.error.call_args_list[1][0][0])
+        self.assertIsNone(self.profiler._cpu)
+        self.assertIsNone(self.profiler._memory_deadline)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.profiler.start_cpu()
+        self.assertIsNotNone(self.profiler._cpu)
+        self.profiler.stop_cpu()
+
+class TestStageTracer(unittest.TestCase):
+
+    def test_stage(self):
+        trace = Trace()
+        with stage(trace, 'a'):
+            time.sleep(0.01)
+        with stage(None, 'a'):
+            pass
+
+        self.assertGreaterEqual(trace.stages['a'], 0.01)
+
+    def test_sampling(self):
+        self.assertIsNone(StageTracer(Mock(), sample_rate=0).start())
+        self.assertIsInstance(StageTracer(Mock(), sample_rate=1).start(), Trace)
+
+    def test_traced_record(self):
+        rec = load_record("test")
+        rec.trace = Trace()
+        app = App()
+        app.logger = Mock()
+        app.tracer.logger = app.logger
+        app.bucket_filter = 'test'
+        app.table = MemoryTable()
+
+        app.process_record(rec)
+
+        message = app.logger.info.call_args[0][0]
+        self.assertTrue(message.startswith("Trace key=test json="))
+        for name in ('condition=', 'dynamodb=', 'total=', 'lag='):
+            self.assertIn(name, message)
+        self.assertIsNone(rec.trace)
+
+if __name__ == '__main__':
+    unittest.main()
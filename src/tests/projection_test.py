@@ -0,0 +1,94 @@
+import unittest
+import os
+import json
+import tempfile
+from unittest.mock import Mock
+from app import App
+from tests.records import load_record
+from projection import compile_projection, load_projection
+from target import DynamoDBTarget
+
+DOC = {
+    'id': 1,
+    'name': 'test',
+    'blob': 'x' * 100,
+    'address': {'city': 'Leeds', 'geo': {'lat': 53.8, 'lon': -1.5}, 'notes': 'long'},
+}
+
+def doc():
+    return json.loads(json.dumps(DOC))
+
+class TestProjection(unittest.TestCase):
+
+    def test_no_rules(self):
+        self.assertIsNone(compile_projection({}))
+        self.assertIsNone(load_projection(None))
+
+    def test_keep_top_level(self):
+        project = compile_projection({'keep': ['id', 'name', 'missing']})
+
+        self.assertEqual(project(doc()), {'id': 1, 'name': 'test'})
+
+    def test_keep_nested(self):
+        project = compile_projection({'keep': ['id', 'address.geo.lat']})
+
+        self.assertEqual(project(doc()), {'id': 1, 'address': {'geo': {'lat': 53.8}}})
+
+    def test_drop(self):
+        project = compile_projection({'drop': ['blob', 'address.notes', 'missing.path']})
+        result = project(doc())
+
+        self.assertNotIn('blob', result)
+        self.assertNotIn('notes', result['address'])
+        self.assertEqual(result['address']['city'], 'Leeds')
+
+    def test_rename(self):
+        project = compile_projection({'rename': {'address.city': 'city', 'name': 'meta.name'}})
+        result = project(doc())
+
+        self.assertEqual(result['city'], 'Leeds')
+        self.assertEqual(result['meta'], {'name': 'test'})
+        self.assertNotIn('city', result['address'])
+
+    def test_flatten(self):
+        project = compile_projection({'flatten': ['address'], 'drop': ['address.notes']})
+
+        self.assertEqual(project(doc()), {'id': 1, 'name': 'test', 'blob': 'x' * 100,
+            'address_city': 'Leeds', 'address_geo_lat': 53.8, 'address_geo_lon': -1.5})
+
+    def test_invalid_rules(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown projection rules'):
+            compile_projection({'select': ['id']})
+        with self.assertRaisesRegex(ValueError, 'Invalid projection path'):
+            compile_projection({'keep': ['a..b']})
+        with self.assertRaisesRegex(ValueError, 'Projection rule keep must be a list of paths'):
+            compile_projection({'keep': 'id'})
+        with self.assertRaisesRegex(ValueError, 'Projection rule flatten must be a list of paths'):
+            compile_projection({'flatten': {'address': True}})
+        with self.assertRaisesRegex(ValueError, 'Projection rule rename must be a mapping of paths'):
+            compile_projection({'rename': [['a', 'b']]})
+        with self.assertRaisesRegex(ValueError, 'Invalid projection path 1'):
+            compile_projection({'drop': [1]})
+
+    def test_load_from_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'keep': ['id']}, f)
+        try:
+            self.assertEqual(load_projection('@' + f.name)(doc()), {'id': 1})
+        finally:
+            os.unlink(f.name)
+
+    def test_dynamodb_build_item(self):
+        rec = load_record("test", vc_format='vclock')
+        app = App()
+        app.logger = Mock()
+        target = DynamoDBTarget(app, projection=compile_projection({'rename': {'test': 'renamed'}}))
+
+        item = target.build_item('test', rec)
+
+        self.assertEqual(item['renamed'], 'data4')
+        self.assertNotIn('test', item)
+        self.assertEqual(item['pkey'], 'test')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import time
+from unittest.mock import Mock
+from app import App
+from tests.records import load_record
+from memtable import MemoryTable, ProvisionedThroughputExceededException, ConditionalCheckFailedException
+from ratelimit import AdaptiveRateLimiter, is_throttle_error
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            AdaptiveRateLimiter(rate=1, min_rate=2)
+        with self.assertRaises(ValueError):
+            AdaptiveRateLimiter(decrease=1)
+
+    def test_additive_increase(self):
+        limiter = AdaptiveRateLimiter(rate=10, increase=5)
+        for _ in range(10):
+            limiter.on_success()
+
+        self.assertAlmostEqual(limiter.rate, 14.2, delta=0.1)
+        self.assertEqual(limiter.success_count, 10)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveRateLimiter(rate=10, min_rate=3)
+        limiter.on_throttle()
+
+        self.assertEqual(limiter.rate, 5)
+
+        limiter.on_throttle()
+
+        self.assertEqual(limiter.rate, 3)
+        self.assertEqual(limiter.throttle_count, 2)
+
+    def test_max_rate(self):
+        limiter = AdaptiveRateLimiter(rate=10, max_rate=10)
+        limiter.on_success()
+
+        self.assertEqual(limiter.rate, 10)
+
+    def test_acquire_paces_writes(self):
+        limiter = AdaptiveRateLimiter(rate=50, min_rate=1, burst=0)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertGreater(limiter.stats()['wait_time'], 0)
+
+    def test_is_throttle_error(self):
+        self.assertTrue(is_throttle_error(ProvisionedThroughputExceededException("throttled", "PutItem")))
+        self.assertFalse(is_throttle_error(ConditionalCheckFailedException("failed", "PutItem")))
+        self.assertFalse(is_throttle_error(ValueError("error")))
+
+class TestAppRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.rec = load_record("test")
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.table = MemoryTable()
+
+    def test_throttled_put_is_retried(self):
+        self.app.table.put_item = Mock(side_effect=[
+            ProvisionedThroughputExceededException("throttled", "PutItem"),
+            ProvisionedThroughputExceededException("throttled", "PutItem"),
+            {}])
+
+        self.app.update_item('test', self.rec)
+
+        self.assertEqual(self.app.table.put_item.call_count, 3)
+        self.assertEqual(self.app.limiter.throttle_count, 2)
+        self.assertEqual(self.app.limiter.success_count, 1)
+        self.app.logger.error.assert_not_called()
+
+    def test_throttled_put_dropped_on_shutdown(self):
+        self.app.table.throttle_rate = 1.0
+        self.app.shutdown = True
+
+        self.app.update_item('test', self.rec)
+
+        self.assertEqual(self.app.limiter.throttle_count, 1)
+        self.app.logger.error.assert_any_call("Put for key=test throttled during shutdown, dropping")
+
+    def test_write_capacity(self):
+        self.app.table.write_capacity = 5
+        self.app.table._capacity_tokens = 1
+        for _ in range(3):
+            self.app.target.write("Put", "test", self.app.table.put_item, Item={'pkey': 'test'})
+
+        self.assertEqual(self.app.limiter.success_count, 3)
+        self.assertEqual(self.app.limiter.throttle_count, self.app.table.throttled_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import urllib3
+from decimal import Decimal
+from unittest.mock import Mock
+from app import App
+from memtable import MemoryTable
+from reconcile import ClockTree, Reconciler, clock_hash
+
+class TestClockTree(unittest.TestCase):
+
+    def test_clock_hash_stable(self):
+        self.assertEqual(clock_hash('k', {'a': 1, 'b': 2}), clock_hash('k', {'b': Decimal(2), 'a': Decimal(1)}))
+        self.assertNotEqual(clock_hash('k', {'a': 1}), clock_hash('k', {'a': 2}))
+        self.assertNotEqual(clock_hash('k', {'a': 1}), clock_hash('j', {'a': 1}))
+
+    def test_identical_trees(self):
+        a = ClockTree(segments=64, branches=8)
+        b = ClockTree(segments=64, branches=8)
+        for i in range(100):
+            a.add(f'key{i}', {'x': i})
+            b.add(f'key{99 - i}', {'x': 99 - i})
+
+        self.assertEqual(a.root(), b.root())
+        self.assertEqual(a.diff(b), set())
+        self.assertEqual(len(a), 100)
+
+    def test_diff(self):
+        a = ClockTree(segments=64, branches=8)
+        b = ClockTree(segments=64, branches=8)
+        for i in range(100):
+            a.add(f'key{i}', {'x': i})
+            b.add(f'key{i}', {'x': i})
+        a.add('key5', {'x': 6})
+        a.add('extra', {'x': 1})
+        b.add('other', {'x': 1})
+
+        self.assertEqual(a.diff(b), {'key5', 'extra', 'other'})
+
+    def test_replace_key(self):
+        a = ClockTree(segments=8, branches=2)
+        b = ClockTree(segments=8, branches=2)
+        a.add('k', {'x': 1})
+        a.add('k', {'x': 2})
+        b.add('k', {'x': 2})
+
+        self.assertEqual(a.root(), b.root())
+
+    def test_invalid_shape(self):
+        with self.assertRaises(ValueError):
+            ClockTree(segments=10, branches=3)
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.bucket_filter = 'test'
+        self.app.table = MemoryTable()
+        for i in range(20):
+            self.app.table.put_item(Item={'pkey': f'key{i}', '_riak_vclocks': {'a': Decimal(i + 1)}})
+        self.riak_clocks = {f'key{i}': {'a': i + 1} for i in range(20)}
+        self.riak = Mock()
+        self.riak.stream_keys.side_effect = lambda bucket, bucket_type: iter(list(self.riak_clocks))
+        self.riak.head_vector_clocks.side_effect = lambda bucket, key, bucket_type: self.riak_clocks.get(key)
+        self.reconciler = Reconciler(self.app, self.riak, 'test', scan_segments=3, workers=2, tree_segments=64)
+
+    def test_scan_target(self):
+        self.assertEqual(len(self.reconciler.scan_target()), 20)
+
+    def test_scan_target_skips_tombstones(self):
+        self.app.table.put_item(Item={'pkey': 'deleted', '_riak_deleted': True, '_riak_vclocks': {'a': Decimal(2)}})
+
+        self.assertNotIn('deleted', self.reconciler.scan_target())
+        self.assertEqual(len(self.reconciler.compare()), 0)
+
+    def test_compare_in_sync(self):
+        self.assertEqual(len(self.reconciler.compare()), 0)
+
+    def test_compare_and_repair(self):
+        self.riak_clocks['key3'] = {'a': 10}
+        self.riak_clocks['new'] = {'a': 1}
+        del self.riak_clocks['key7']
+        self.riak.get_object.side_effect = lambda bucket, key, bucket_type: {
+            'value': b'{"test":"data"}',
+            'vector_clocks': self.riak_clocks[key],
+            'content_type': b'application/json',
+            'last_modified': '1618846125.0'}
+
+        result = self.reconciler.compare()
+
+        self.assertEqual(result.mismatched, {'key3'})
+        self.assertEqual(result.missing_in_target, {'new'})
+        self.assertEqual(result.missing_in_riak, {'key7'})
+
+        self.reconciler.repair(result)
+
+        self.assertEqual(self.app.table.get_item(Key={'pkey': 'key3'})['Item']['_riak_vclocks'], {'a': 10})
+        self.assertEqual(self.app.table.get_item(Key={'pkey': 'new'})['Item']['test'], 'data')
+        self.assertNotIn('Item', self.app.table.get_item(Key={'pkey': 'key7'}))
+        self.assertEqual(len(self.reconciler.compare()), 0)
+
+    def test_fetch_riak_bounds_pending(self):
+        collect = self.reconciler._collect
+        pending_sizes = []
+        def record_pending(pending, clocks):
+            pending_sizes.append(len(pending))
+            collect(pending, clocks)
+        self.reconciler._collect = record_pending
+        self.reconciler.max_pending = 4
+
+        self.assertEqual(self.reconciler.fetch_riak(), self.riak_clocks)
+        self.assertEqual(max(pending_sizes), 4)
+        self.assertEqual(len(pending_sizes), 20)
+
+    def test_repair_failures_are_counted(self):
+        self.riak_clocks['key3'] = {'a': 10}
+        self.riak_clocks['key4'] = {'a': 10}
+        def get_object(bucket, key, bucket_type):
+            if key == 'key3':
+                raise urllib3.exceptions.HTTPError("invalid http response code 300")
+            return {'value': b'{"test":"data"}', 'vector_clocks': self.riak_clocks[key],
+                'content_type': b'application/json', 'last_modified': '1618846125.0'}
+        self.riak.get_object.side_effect = get_object
+
+        self.assertEqual(self.reconciler.repair(self.reconciler.compare()), 1)
+
+        self.app.logger.error.assert_any_call("Repair for key=key3 failed: invalid http response code 300")
+        self.app.logger.info.assert_called_with("Repaired 1 keys, 1 failed")
+        self.assertEqual(self.app.table.get_item(Key={'pkey': 'key4'})['Item']['_riak_vclocks'], {'a': 10})
+
+    def test_repair_counts_records_not_applied(self):
+        self.riak_clocks['key3'] = {'a': 10}
+        self.riak_clocks['key4'] = {'a': 10}
+        def get_object(bucket, key, bucket_type):
+            content_type = b'application/octet-stream' if key == 'key4' else b'application/json'
+            return {'value': b'{"test":"data"}', 'vector_clocks': self.riak_clocks[key],
+                'content_type': content_type, 'last_modified': '1618846125.0'}
+        self.riak.get_object.side_effect = get_object
+        self.app.table.put_item = Mock(side_effect=ValueError("Item size has exceeded the maximum allowed size"))
+
+        self.assertEqual(self.reconciler.repair(self.reconciler.compare()), 2)
+
+        self.app.logger.error.assert_any_call("Repair for key=key3 failed: failed")
+        self.app.logger.error.assert_any_call("Repair for key=key4 failed: skipped")
+        self.app.logger.info.assert_called_with("Repaired 0 keys, 2 failed")
+
+    def test_repair_tombstones_missing_in_riak(self):
+        self.app.target.tombstones = True
+        del self.riak_clocks['key7']
+
+        self.assertEqual(self.reconciler.repair(self.reconciler.compare()), 0)
+
+        item = self.app.table.get_item(Key={'pkey': 'key7'})['Item']
+        self.assertTrue(item['_riak_deleted'])
+        self.assertEqual(item['_riak_vclocks'], {'a': 8})
+        self.assertIn('_riak_ttl', item)
+        self.assertEqual(len(self.reconciler.compare()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
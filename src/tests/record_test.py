@@ -1,6 +1,8 @@
 import unittest
 import os
-from record import ReplRecord, TooManySiblingsError
+import pickle
+import copy
+from record import ReplRecord, TooManySiblingsError, VectorClock
 
 class TestReplRecord(unittest.TestCase):
 
@@ -49,6 +51,37 @@ class TestReplRecord(unittest.TestCase):
         self.assertEqual(rec.vtag, b'5kzmcxRpTdtQFl0IIuAbkF')
         self.assertIn({b'content-type': b'application/json'}, rec.metadata)
 
+    def test_metadata_index(self):
+        """
+        Test metadata is held in a single mapping with the list view built on access
+        """
+        with open(os.path.dirname(os.path.abspath(__file__)) + "/data/test",'rb') as f:
+            data = f.read()
+
+        rec = ReplRecord(data)
+
+        self.assertEqual(rec.content_type, b'application/json')
+        self.assertEqual(rec.meta[b'content-type'], b'application/json')
+        self.assertEqual(len(rec.metadata), len(rec.meta))
+        self.assertFalse(hasattr(rec, '__dict__'))
+
+        rec.metadata = [{b'content-type': b'text/plain'}]
+
+        self.assertEqual(rec.content_type, b'text/plain')
+
+    def test_normal_put_vc_format_vclock(self):
+        """
+        Test a normal PUT record can be decoded with vc_format=vclock
+        """
+        with open(os.path.dirname(os.path.abspath(__file__)) + "/data/test",'rb') as f:
+            data = f.read()
+
+        rec = ReplRecord(data, vc_format='vclock')
+
+        self.assertIsInstance(rec.vector_clocks, VectorClock)
+        self.assertEqual(rec.vector_clocks, {'1090001219101612390251762380001': 2,
+            '1090008191016123902515938': 2})
+
     def test_invalid_vc_format(self):
         with self.assertRaisesRegex(ValueError,'Invalid vector clock format invalid'):
             ReplRecord(b'', vc_format='invalid')
@@ -182,6 +215,53 @@ class TestReplRecord(unittest.TestCase):
         with self.assertRaisesRegex(ValueError,'invalid compression flag'):
             ReplRecord(data)
 
+class TestVectorClock(unittest.TestCase):
+
+    def test_mapping(self):
+        vc = VectorClock({'b': 2, 'a': 1})
+
+        self.assertEqual(list(vc), ['a', 'b'])
+        self.assertEqual(vc['b'], 2)
+        self.assertEqual(vc.get('c', 0), 0)
+        self.assertEqual(dict(vc), {'a': 1, 'b': 2})
+        self.assertEqual(vc, VectorClock([('a', 1), ('b', 2)]))
+        with self.assertRaises(KeyError):
+            vc['c']
+
+    def test_descends(self):
+        vc = VectorClock({'a': 2, 'b': 1})
+
+        self.assertTrue(vc.descends({'a': 1}))
+        self.assertTrue(vc.descends(vc))
+        self.assertTrue(vc.descends({}))
+        self.assertFalse(vc.descends({'a': 3}))
+        self.assertFalse(vc.descends({'c': 1}))
+
+    def test_dominates_and_concurrent(self):
+        a = VectorClock({'a': 2, 'b': 1})
+        b = VectorClock({'a': 1, 'b': 1})
+        c = VectorClock({'a': 1, 'b': 2})
+
+        self.assertTrue(a.dominates(b))
+        self.assertFalse(a.dominates(a))
+        self.assertFalse(b.dominates(a))
+        self.assertTrue(a.concurrent(c))
+        self.assertFalse(a.concurrent(b))
+
+    def test_merge(self):
+        merged = VectorClock({'a': 2, 'b': 1}).merge({'b': 3, 'c': 1})
+
+        self.assertEqual(merged, {'a': 2, 'b': 3, 'c': 1})
+
+    def test_serialization(self):
+        vc = VectorClock({'1090001219101612390251762380001': 300, '1090008191016123902515938': 2})
+
+        self.assertEqual(VectorClock.from_bytes(vc.to_bytes()), vc)
+        self.assertEqual(vc.to_bytes(), VectorClock(dict(reversed(list(vc.items())))).to_bytes())
+        self.assertEqual(pickle.loads(pickle.dumps(vc)), vc)
+        self.assertEqual(copy.deepcopy(vc), vc)
+        with self.assertRaisesRegex(ValueError, 'truncated vector clock'):
+            VectorClock.from_bytes(vc.to_bytes()[:-1])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+from record import ReplRecord, VectorClock
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def load_record(name: str, vc_format: str = 'dict'):
+    """Parse a queue response saved in the data directory."""
+    with open(os.path.join(DATA_DIR, name), 'rb') as f:
+        return ReplRecord(f.read(), vc_format=vc_format)
+
+def make_record(key: bytes, clocks: dict = None, value: bytes = None, is_delete: bool = False,
+        bucket_type: bytes = None):
+    """Build a record in bucket test with VectorClock clocks, a JSON value if given."""
+    rec = ReplRecord(vc_format='vclock')
+    rec.bucket_type = bucket_type
+    rec.bucket = b'test'
+    rec.key = key
+    rec.is_delete = is_delete
+    rec.last_modified = '1618846125.0'
+    if clocks is not None:
+        rec.vector_clocks = VectorClock(clocks)
+    if value is not None:
+        rec.value = value
+        rec.meta[b'content-type'] = b'application/json'
+    return rec
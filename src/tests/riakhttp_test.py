@@ -0,0 +1,65 @@
+import unittest
+import base64
+import zlib
+from unittest.mock import Mock
+import urllib3
+from riakhttp import RiakHttpClient, decode_http_vector_clocks
+
+VCLOCK = base64.b64decode(b'g2wAAAACaAJtAAAACL8Aoe8A+zsmaAJhAm4FAHcc8tkOaAJtAAAADL8Aoe8A+0zuAAAAAWgCYQJuBQCtHfLZDmo=')
+VCLOCK_DICT = {'1090001219101612390251762380001': 2, '1090008191016123902515938': 2}
+
+def deflate(data: bytes):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class TestRiakHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = RiakHttpClient('localhost', 8098)
+        self.client._http = Mock()
+
+    def test_decode_http_vector_clocks(self):
+        self.assertEqual(decode_http_vector_clocks(base64.b64encode(deflate(VCLOCK))), VCLOCK_DICT)
+        self.assertEqual(decode_http_vector_clocks(base64.b64encode(VCLOCK)), VCLOCK_DICT)
+
+    def test_object_path(self):
+        self.assertEqual(self.client.object_path('b', 'a/key'), '/buckets/b/keys/a%2Fkey')
+        self.assertEqual(self.client.object_path('b', 'k', 't'), '/types/t/buckets/b/keys/k')
+
+    def test_stream_keys(self):
+        response = Mock(status=200)
+        response.stream.return_value = [b'{"keys":[]}{"keys":["a",', b'"b"]}', b'{"keys":["c"]}']
+        self.client._http.request.return_value = response
+
+        self.assertEqual(list(self.client.stream_keys('test')), ['a', 'b', 'c'])
+        response.release_conn.assert_called_once()
+
+    def test_stream_keys_error(self):
+        self.client._http.request.return_value = Mock(status=500)
+
+        with self.assertRaises(urllib3.exceptions.HTTPError):
+            list(self.client.stream_keys('test'))
+
+    def test_head_vector_clocks(self):
+        self.client._http.request.side_effect = [
+            Mock(status=200, headers={'X-Riak-Vclock': base64.b64encode(deflate(VCLOCK))}),
+            Mock(status=404)]
+
+        self.assertEqual(self.client.head_vector_clocks('test', 'a'), VCLOCK_DICT)
+        self.assertIsNone(self.client.head_vector_clocks('test', 'b'))
+
+    def test_get_object(self):
+        self.client._http.request.return_value = Mock(status=200, data=b'{"test":"data"}', headers={
+            'X-Riak-Vclock': base64.b64encode(deflate(VCLOCK)),
+            'Content-Type': 'application/json; charset=utf-8',
+            'Last-Modified': 'Mon, 19 Apr 2021 15:28:45 GMT'})
+
+        obj = self.client.get_object('test', 'a')
+
+        self.assertEqual(obj['value'], b'{"test":"data"}')
+        self.assertEqual(obj['vector_clocks'], VCLOCK_DICT)
+        self.assertEqual(obj['content_type'], b'application/json')
+        self.assertEqual(obj['last_modified'], '1618846125.0')
+
+if __name__ == '__main__':
+    unittest.main()
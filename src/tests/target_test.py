@@ -0,0 +1,159 @@
+import unittest
+import os
+import json
+import tempfile
+from unittest.mock import Mock
+from app import App
+from memtable import MemoryTable
+from projection import compile_projection
+from record import VectorClock
+from tests.records import load_record
+from hotkeys import HotKeyTracker, Debouncer
+from target import DynamoDBTarget, SQLiteTarget, NDJSONTarget, APPLIED, STALE, FAILED, SKIPPED, HELD, clocks_newer
+
+class TestTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.rec = load_record("test")
+        self.delete = load_record("test3")
+        self.logger = Mock()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_clocks_newer(self):
+        self.assertTrue(clocks_newer({'a': 1}, None))
+        self.assertTrue(clocks_newer({'a': 2}, {'a': 1}))
+        self.assertTrue(clocks_newer({'a': 1, 'b': 1}, {'a': 1}))
+        self.assertFalse(clocks_newer({'a': 1}, {'a': 1}))
+        self.assertFalse(clocks_newer({'a': 1}, {'a': 2, 'b': 1}))
+
+    def test_dynamodb_target(self):
+        app = App()
+        app.logger = Mock()
+        app.table = MemoryTable()
+        target = DynamoDBTarget(app)
+
+        self.assertEqual(target.apply([self.rec, self.rec]), [APPLIED, STALE])
+        self.assertEqual(app.table.get_item(Key={'pkey': 'test'})['Item']['test'], 'data4')
+
+    def test_sqlite_target(self):
+        target = SQLiteTarget(os.path.join(self.tmpdir.name, 'repl.db'), self.logger)
+
+        self.assertEqual(target.apply([self.rec, self.rec]), [APPLIED, STALE])
+
+        item = target.get('test')
+        self.assertEqual(item['data'], {'test': 'data4'})
+        self.assertEqual(item['_riak_vclocks'], self.rec.vector_clocks)
+        self.assertEqual(item['_riak_lm'], '1618846125.126554')
+
+        self.assertEqual(target.apply([self.delete]), [APPLIED])
+        self.assertIsNone(target.get('test'))
+        target.close()
+
+    def test_sqlite_target_projection(self):
+        target = SQLiteTarget(os.path.join(self.tmpdir.name, 'repl.db'), self.logger,
+            projection=compile_projection({'rename': {'test': 'renamed'}}))
+
+        self.assertEqual(target.apply([self.rec]), [APPLIED])
+        self.assertEqual(target.get('test')['data'], {'renamed': 'data4'})
+        target.close()
+
+    def test_sqlite_target_tombstones(self):
+        target = SQLiteTarget(os.path.join(self.tmpdir.name, 'repl.db'), self.logger, tombstones=True)
+
+        self.assertEqual(target.apply([self.delete, self.rec]), [APPLIED, STALE])
+        self.assertIsNone(target.get('test'))
+        row = target._conn.execute("SELECT vclocks, data FROM items WHERE pkey = 'test'").fetchone()
+        self.assertEqual(json.loads(row[0]), self.delete.vector_clocks)
+        self.assertIsNone(row[1])
+        target.close()
+
+    def test_sqlite_target_failed_record(self):
+        target = SQLiteTarget(os.path.join(self.tmpdir.name, 'repl.db'), self.logger)
+        bad = load_record("test7")
+        bad.value = b'not json'
+
+        self.assertEqual(target.apply([bad, self.rec]), [FAILED, APPLIED])
+        target.close()
+
+    def test_ndjson_target(self):
+        path = os.path.join(self.tmpdir.name, 'repl.ndjson')
+        target = NDJSONTarget(path, self.logger)
+
+        self.assertEqual(target.apply([self.rec, self.delete]), [APPLIED, APPLIED])
+        target.close()
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]['op'], 'put')
+        self.assertEqual(lines[0]['data'], {'test': 'data4'})
+        self.assertEqual(lines[1]['op'], 'delete')
+        self.assertEqual(lines[1]['pkey'], 'test')
+
+    def test_ndjson_target_projection(self):
+        path = os.path.join(self.tmpdir.name, 'repl.ndjson')
+        target = NDJSONTarget(path, self.logger, projection=compile_projection({'drop': ['test']}))
+
+        self.assertEqual(target.apply([self.rec, self.delete]), [APPLIED, APPLIED])
+        target.close()
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]['data'], {})
+        self.assertIsNone(lines[1]['data'])
+
+class TestAppTarget(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.app.logger = Mock()
+        self.app.bucket_filter = 'test'
+
+    def tearDown(self):
+        os.environ.pop('REPL_TARGET', None)
+        os.environ.pop('REPL_TARGET_PATH', None)
+
+    def test_setup_target(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ['REPL_TARGET'] = 'ndjson'
+            os.environ['REPL_TARGET_PATH'] = os.path.join(tmpdir, 'repl.ndjson')
+            self.app.projection = compile_projection({'keep': ['id']})
+            target = self.app.setup_target()
+            self.assertIsInstance(target, NDJSONTarget)
+            self.assertIs(target.projection, self.app.projection)
+            target.close()
+
+        os.environ['REPL_TARGET'] = 'invalid'
+        with self.assertRaisesRegex(ValueError, 'Invalid replication target invalid'):
+            self.app.setup_target()
+
+    def test_process_records_filters_batch(self):
+        self.app.target = Mock()
+        self.app.target.apply.return_value = [APPLIED, APPLIED]
+        rec = load_record("test")
+        delete = load_record("test3")
+
+        self.assertEqual(self.app.process_records([rec, load_record("test7"), delete]), [APPLIED, SKIPPED, APPLIED])
+        self.app.target.apply.assert_called_once_with([rec, delete])
+        self.app.logger.warning.assert_called_with("Key not JSON or wrong bucket testBucket testKey")
+
+    def test_process_records_results_align(self):
+        self.app.target = Mock()
+        self.app.target.apply.side_effect = lambda records: [FAILED] * len(records)
+        self.app.hot_keys = HotKeyTracker(k=1, min_count=3)
+        self.app.debouncer = Debouncer(60)
+        old = load_record("test")
+        old.vector_clocks = VectorClock({'a': 1})
+        new = load_record("test")
+        new.vector_clocks = VectorClock({'a': 2})
+        hot = load_record("test")
+        hot.vector_clocks = VectorClock({'a': 3})
+
+        self.assertEqual(self.app.process_records([old, load_record("test7"), new]), [STALE, SKIPPED, FAILED])
+        self.assertEqual(self.app.process_records([hot]), [HELD])
+        self.app.target.apply.assert_called_once_with([new])
+
+if __name__ == '__main__':
+    unittest.main()